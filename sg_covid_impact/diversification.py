@@ -1,8 +1,11 @@
+import logging
+import os
 import pandas as pd
 import numpy as np
 import altair as alt
 from itertools import combinations
 import networkx as nx
+from scipy import sparse
 import sg_covid_impact
 from sg_covid_impact.make_sic_division import extract_sic_code_description
 from sg_covid_impact.descriptive import (
@@ -35,9 +38,16 @@ def month_string_from_datetime(dt):
 
 
 def load_predicted():
-    return pd.read_csv(
-        f"{project_dir}/data/processed/glass_companies_predicted_labels_v2.csv"
-    )
+    """Reads the predicted division probabilities of Glass companies
+
+    Reads the parquet output of `sector_prediction.predict_divisions` and
+    falls back to the csv written by earlier versions.
+    """
+    path = f"{project_dir}/data/processed/glass_companies_predicted_labels_v2"
+    if os.path.exists(f"{path}.parquet"):
+        return pd.read_parquet(f"{path}.parquet")
+    logging.warning(f"{path}.parquet not found, reading predictions from csv")
+    return pd.read_csv(f"{path}.csv")
 
 
 def extract_sectors(pred_df, thres):
@@ -84,14 +94,16 @@ def extract_network(_list):
     return n
 
 
-def make_sector_space_base(sector_space, extra_edges=100):
-    """Creates the base for a sector space network
+def make_sector_space_graph(sector_space, extra_edges=100):
+    """Creates the graph for a sector space network (maximum spanning tree
+    plus the strongest remaining edges)
     Args:
         sector_space (network): nx network object
         extra_edges (int): extra edges to add to the maximum spanning tree
     """
 
     max_tree = nx.maximum_spanning_tree(sector_space)
+    max_tree_edges = set(max_tree.edges())
 
     top_edges_net = nx.Graph(
         [
@@ -101,12 +113,23 @@ def make_sector_space_base(sector_space, extra_edges=100):
                 key=lambda x: x[2]["weight"],
                 reverse=True,
             )
-            if (x[0], x[1]) not in list(max_tree.edges())
+            if (x[0], x[1]) not in max_tree_edges
         ][:extra_edges]
     )
     united_graph = nx.Graph(
         list(max_tree.edges(data=True)) + list(top_edges_net.edges(data=True))
     )
+    return united_graph
+
+
+def make_sector_space_base(sector_space, extra_edges=100):
+    """Creates the base for a sector space network
+    Args:
+        sector_space (network): nx network object
+        extra_edges (int): extra edges to add to the maximum spanning tree
+    """
+
+    united_graph = make_sector_space_graph(sector_space, extra_edges)
 
     pos = nx.kamada_kawai_layout(united_graph, dim=2)
 
@@ -116,7 +139,9 @@ def make_sector_space_base(sector_space, extra_edges=100):
 
 
 # Diversification options based on network structure
-def make_diversification_options(network, exposure_ranking, month, exposed, safe):
+def make_diversification_options(
+    network, exposure_ranking, month, exposed, safe, path_lengths=None
+):
     """Extracts minimum and mean distances of negatively exposed sectors
     to neutrally or positively exposed sectors
     Args:
@@ -125,6 +150,9 @@ def make_diversification_options(network, exposure_ranking, month, exposed, safe
         month (int): month
         exposed (list): high exposure rankings
         safe (list): low exposure rankings
+        path_lengths (dict): precomputed shortest path lengths between nodes
+            (eg from nx.all_pairs_shortest_path_length). If None we calculate
+            them for each pair of sectors
     """
     division_exposure_month = {
         k[0]: v for k, v in exposure_ranking.items() if k[1] == month
@@ -141,7 +169,10 @@ def make_diversification_options(network, exposure_ranking, month, exposed, safe
     for e in exposed_divs:
         dists = []
         for s in safe_divs:
-            length = nx.shortest_path_length(network, e, s)
+            length = None if path_lengths is None else path_lengths.get(e, {}).get(s)
+            if length is None:
+                # Disconnected pairs raise NetworkXNoPath as before
+                length = nx.shortest_path_length(network, e, s)
             dists.append(length)
 
         d[e] = {"mean": np.mean(dists), "min": min(dists)}
@@ -150,38 +181,113 @@ def make_diversification_options(network, exposure_ranking, month, exposed, safe
     return df
 
 
-def make_neighbor_shares(network, exposure_ranking, month):
+def make_sparse_adjacency(network, nodes, weight=None):
+    """Creates a sparse (symmetric) adjacency matrix for a network
+    Args:
+        network (networkx): network object
+        nodes (list): node order for the rows and columns
+        weight (str): edge attribute to use as weight. If None all edges weigh 1
+    """
+    node_idx = {n: i for i, n in enumerate(nodes)}
+
+    edges = list(network.edges(data=True))
+    rows = [node_idx[e[0]] for e in edges]
+    cols = [node_idx[e[1]] for e in edges]
+    vals = [1 if weight is None else e[2].get(weight, 1) for e in edges]
+
+    adj = sparse.coo_matrix(
+        (vals + vals, (rows + cols, cols + rows)), shape=(len(nodes), len(nodes))
+    )
+    return adj.tocsr()
+
+
+def make_neighbor_shares_all(network, exposure_ranking, weight=None):
+    """Extracts the exposure distribution of every sector's neighbours
+    in every month
+    Args:
+        network (networkx): network object
+        exposure_ranking (dict): lookup between division, month and exposure
+        weight (str): edge attribute to weight neighbours by. If None
+            all neighbours count the same
+    Returns:
+        df indexed by month and division with the share of neighbours in
+        each exposure ranking and the number of neighbours (neighbour_n)
+    """
+    nodes = list(network.nodes)
+    node_idx = {n: i for i, n in enumerate(nodes)}
+
+    exposures = (
+        pd.Series(exposure_ranking)
+        .rename_axis(["division", "month_year"])
+        .reset_index(name="rank")
+    )
+    exposures = exposures.loc[exposures["division"].isin(node_idx)]
+
+    months = sorted(set(exposures["month_year"]))
+    ranks = sorted(set(exposures["rank"]))
+    month_idx = {m: i for i, m in enumerate(months)}
+    rank_idx = {r: i for i, r in enumerate(ranks)}
+
+    # One hot encoding of each node's exposure ranking (columns are month x rank)
+    one_hot = sparse.csr_matrix(
+        (
+            np.ones(len(exposures)),
+            (
+                exposures["division"].map(node_idx).values,
+                exposures["month_year"].map(month_idx).values * len(ranks)
+                + exposures["rank"].map(rank_idx).values,
+            ),
+        ),
+        shape=(len(nodes), len(months) * len(ranks)),
+    )
+
+    adj = make_sparse_adjacency(network, nodes, weight)
+
+    counts = (
+        (adj @ one_hot).toarray().reshape(len(nodes), len(months), len(ranks))
+    ).transpose(1, 0, 2)
+    totals = counts.sum(axis=2, keepdims=True)
+    shares = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+
+    df = pd.DataFrame(
+        shares.reshape(len(months) * len(nodes), len(ranks)),
+        index=pd.MultiIndex.from_product(
+            [months, nodes], names=["month_year", "division"]
+        ),
+        columns=ranks,
+    )
+    df["neighbour_n"] = np.tile([network.degree(n) for n in nodes], len(months))
+
+    return df
+
+
+def make_neighbor_shares(network, exposure_ranking, month, weight=None):
     """Extracts the number of neighbors and their exposure for a sector
     Args:
         network (networkx): network object
         exposure_ranking (dict): lookup between division, month and exposure
         month: month to focus on
+        weight (str): edge attribute to weight neighbours by. If None
+            all neighbours count the same
     """
 
     division_exposure_month = {
         k[0]: v for k, v in exposure_ranking.items() if k[1] == month
     }
 
-    neighb = []
-    neighb_n = {}
+    df = make_neighbor_shares_all(
+        network, {(k, month): v for k, v in division_exposure_month.items()}, weight
+    ).loc[month]
 
-    for x in network.nodes:
-        neighbors = list(nx.neighbors(network, x))
-
-        neighbor_exposures = pd.Series(
-            [division_exposure_month[n] for n in neighbors], name=x
-        ).value_counts(normalize=True)
-        neighb.append(neighbor_exposures)
-        neighb_n[x] = len(list(neighbors))
+    # Only keep exposure rankings present in some neighbourhood
+    df = df.loc[:, (df != 0).any() | (df.columns == "neighbour_n")]
+    df.index.name = None
 
     exposure_sorted = (
         pd.Series(division_exposure_month).sort_values(ascending=False).index.tolist()
     )
 
-    df = pd.DataFrame(neighb)
-    df["neighbour_n"] = df.index.map(neighb_n)
-
-    return df.loc[exposure_sorted].fillna(0)
+    return df.reindex(exposure_sorted).fillna(0)
 
 
 def estimate_div_shares_geo(exposure_levels, monthly_div_rankings, geo):
@@ -3,22 +3,25 @@
 import logging
 import pickle
 import re
-import pandas as pd
+from functools import partial
 from toolz.curried import pipe
 
 from sg_covid_impact.make_sic_division import extract_sic_code_description
 from sg_covid_impact.sic import load_sic_taxonomy
 from sg_covid_impact.nlp import (
     clean_and_tokenize,
+    tokenize_parallel,
     make_ngram,
+    PHRASE_MODEL_DIR,
     flatten_freq,
-    get_category_salience,
+    salient_words_all_categories,
     remove_dupes,
 )
 import sg_covid_impact
 from sg_covid_impact.getters.companies_house import get_sector
 from sg_covid_impact.getters.glass import get_organisation_description
 from sg_covid_impact.getters.glass_house import get_glass_house
+from sg_covid_impact.queries.glass_house import get_top_matches
 
 project_dir = sg_covid_impact.project_dir
 
@@ -36,31 +39,7 @@ def get_glass_ch_top_matches(gl_ch):
     Args:
         gl_h: glass-ch lookup
     """
-
-    # Find Companies House companies with multiple matches
-    gl_multi_matches = (
-        gl_ch.groupby("company_number")
-        .size()
-        .reset_index(name="n_matches")
-        .query("n_matches>1")["company_number"]
-        .tolist()
-    )
-
-    # For those, find the top matching glass org
-    gl_top_match = (
-        gl_ch.loc[gl_ch["company_number"].isin(gl_multi_matches)]
-        .groupby("company_number")
-        .apply(lambda x: x.sort_values("score", ascending=False).iloc[0, :])
-        .reset_index(drop=True)
-    )
-
-    # Combine with the one-matched glass orgs
-    gl_unique_matches = pd.concat(
-        [gl_ch.loc[~gl_ch["company_number"].isin(gl_multi_matches)], gl_top_match],
-        axis=0,
-    ).reset_index(drop=True)
-
-    return gl_unique_matches
+    return get_top_matches(gl_ch).reset_index(drop=True)
 
 
 def make_glass_ch_sectors(glass_descr, glass_ch, ch_sectors, threshold=60):
@@ -106,10 +85,12 @@ def glass_descr_preprocessing(gl_descr):
     Args:
         gl_desc (df): glass description
     """
-    glass_tokenised = glass_w_descr["description"].apply(
-        lambda x: clean_and_tokenize(x, remove_stops=True)
+    glass_tokenised = list(
+        tokenize_parallel(
+            gl_descr["description"], partial(clean_and_tokenize, remove_stops=True)
+        )
     )
-    return make_ngram(glass_tokenised, n_gram=2)
+    return make_ngram(glass_tokenised, n_gram=2, cache_dir=PHRASE_MODEL_DIR)
 
 
 def extract_salient_terms(
@@ -122,15 +103,10 @@ def extract_salient_terms(
         sector (str): variable with sector
         word_thres (int): Minimum number of variables to consider
     """
-    corpus_freqs = flatten_freq(glass_descr[tokenised_variable])
-
-    # Creates a dict
-    sector_salient_words = {
-        w: get_category_salience(
-            glass_descr, sector, w, tokenised_variable, corpus_freqs, thres=75
-        )
-        for w in sorted(set(glass_w_descr[sector]))
-    }
+    # Creates a dict with the salient terms of every sector
+    sector_salient_words = salient_words_all_categories(
+        glass_descr[tokenised_variable], glass_descr[sector], thres=word_thres
+    )
 
     return sector_salient_words
 
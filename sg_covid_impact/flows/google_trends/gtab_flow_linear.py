@@ -2,6 +2,7 @@
 import json
 import logging
 import os
+import shutil
 import subprocess
 import sys
 from itertools import product
@@ -35,7 +36,14 @@ from metaflow import (
 from gtab import GTAB as GTAB_original
 from tenacity import RetryError
 
-from utils import set_gtab_timeframe, gtab_query, anchor_period_to_anchor_filename
+from utils import (
+    RequestCache,
+    TokenBucket,
+    anchor_period_to_anchor_filename,
+    make_thread_query,
+    query_concurrently,
+    set_gtab_timeframe,
+)
 from utils import GTAB as GTAB_patched
 
 
@@ -72,6 +80,34 @@ class GoogleTrends(FlowSpec):
         default="s3://nesta-glass/anchorbanks",
     )
 
+    n_threads = Parameter(
+        "n-threads",
+        help="Number of terms to query concurrently",
+        type=int,
+        default=8,
+    )
+
+    requests_per_second = Parameter(
+        "requests-per-second",
+        help="Maximum rate of requests to Google Trends (across all threads)",
+        type=float,
+        default=1.0,
+    )
+
+    request_cache_location = Parameter(
+        "request-cache-location",
+        help="S3 path of the cache of Google Trends requests (shared across runs)",
+        type=str,
+        default="s3://nesta-glass/anchorbanks/request_cache.sqlite",
+    )
+
+    request_cache_ttl = Parameter(
+        "request-cache-ttl",
+        help="Number of days after which cached requests expire",
+        type=float,
+        default=30.0,
+    )
+
     test_mode = Parameter(
         "test_mode",
         help="Whether to run in test mode (fetch a subset of data)",
@@ -114,6 +150,21 @@ class GoogleTrends(FlowSpec):
             files = t.pipe(s3.list_paths(), t.map(attrgetter("key")), set)
         return anchor_period_to_anchor_filename(anchor_period) in files
 
+    def _fetch_request_cache(self, path: str):
+        """Download the request cache to `path` (if it exists)."""
+        with S3() as s3:
+            obj = s3.get(self.request_cache_location, return_missing=True)
+            if obj.exists:
+                shutil.copyfile(obj.path, path)
+
+    def _store_request_cache(self, request_cache: RequestCache):
+        """Upload a copy of `request_cache`."""
+        path = f"{request_cache.path}.upload"
+        request_cache.backup(path)
+        with S3() as s3:
+            s3.put_files([(self.request_cache_location, path)])
+        os.remove(path)
+
     @step
     def build_anchor(self):
         pip_install()
@@ -184,8 +235,16 @@ class GoogleTrends(FlowSpec):
             completed_chunks = json.loads(s3.get(self.s3_completed_key).text)
 
         gtab = GTAB_patched()
-        # Defer retrying to our own logic and sleep longer
-        gtab.set_options(conn_config={"retries": 0}, gtab_config={"sleep": 1})
+        # Defer retrying to our own logic
+        gtab.set_options(conn_config={"retries": 0})
+        # Rate limit requests across all threads
+        gtab.rate_limiter = TokenBucket(self.requests_per_second)
+        # Cache requests so retries and re-runs don't repeat answered requests
+        request_cache_path = f"{gtab.dir_path}/output/request_cache.sqlite"
+        self._fetch_request_cache(request_cache_path)
+        gtab.request_cache = RequestCache(
+            request_cache_path, ttl=self.request_cache_ttl * 24 * 3600
+        )
         for chunk_number, (term_chunk, anchor_period) in enumerate(self.param_grid):
             # Don't perform if completed
             if chunk_number in completed_chunks:
@@ -213,21 +272,23 @@ class GoogleTrends(FlowSpec):
                     )
 
             completed_terms = results.variable.unique()
-            for term in filter(lambda term: term not in completed_terms, term_chunk):
-                try:
-                    result = (
-                        gtab_query(term, gtab)
-                        .to_frame()
-                        .pipe(format_results, anchor_period)
+            terms = [term for term in term_chunk if term not in completed_terms]
+            try:
+                # Query terms concurrently, each thread with its own copy of
+                # `gtab` sharing the anchor bank and rate limiter
+                for term, result in query_concurrently(
+                    terms, make_thread_query(gtab), n_threads=self.n_threads
+                ):
+                    results = results.append(
+                        result.to_frame().pipe(format_results, anchor_period)
                     )
-                except RetryError as e:
-                    logging.error(e)
-                    # Upload current results to s3
-                    with S3(run=Run(f"GoogleTrends/{data_run_id}")) as s3:
-                        s3.put(s3_chunk_key, serialise_to_jsons(results))
-                    raise e
-
-                results = results.append(result)
+            except RetryError as e:
+                logging.error(e)
+                # Upload current results to s3
+                with S3(run=Run(f"GoogleTrends/{data_run_id}")) as s3:
+                    s3.put(s3_chunk_key, serialise_to_jsons(results))
+                self._store_request_cache(gtab.request_cache)
+                raise e
 
             output = results  # .pipe(format_results, anchor_period)
 
@@ -240,6 +301,7 @@ class GoogleTrends(FlowSpec):
                     self.s3_completed_key,
                     json.dumps(completed_chunks),
                 )
+            self._store_request_cache(gtab.request_cache)
 
         # self.completed_chunks = True
         self.next(self.end)
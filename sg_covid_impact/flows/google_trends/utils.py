@@ -16,8 +16,13 @@ import os
 import pickle
 import random
 import shutil
+import sqlite3
+import threading
 import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, TypeVar
 
 import networkx as nx
 import numpy as np
@@ -76,6 +81,190 @@ def gtab_query(word: str, gtab: GTAB_) -> pd.Series:
         return pd.Series([result], name=word_clean)
 
 
+class TokenBucket:
+    """Thread-safe token bucket rate limiter.
+
+    Args:
+        rate: Tokens added per second.
+        capacity: Maximum number of tokens (i.e. burst size).
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestCache:
+    """Persistent cache of Google Trends requests in a SQLite database.
+
+    Results are keyed by the normalised keywords and the pytrends payload
+    options (e.g. timeframe and geo). Safe to share between threads.
+
+    Args:
+        path: SQLite database file.
+        ttl: Seconds after which a cached result expires.
+        max_bytes: Maximum size of the cached results. The least recently
+            used results are evicted beyond it.
+    """
+
+    def __init__(
+        self, path: str, ttl: float = 30 * 24 * 3600, max_bytes: int = 2 ** 30
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS requests "
+                "(key TEXT PRIMARY KEY, value BLOB, size INTEGER, created REAL, "
+                "accessed REAL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        con = sqlite3.connect(self.path, timeout=60)
+        try:
+            with con:  # Commits on success
+                yield con
+        finally:
+            con.close()
+
+    @staticmethod
+    def make_key(keywords: List[str], payload_config: dict) -> str:
+        """Cache key of a request for `keywords` with `payload_config`."""
+        keywords = [" ".join(keyword.split()).lower() for keyword in keywords]
+        return json.dumps([keywords, payload_config], sort_keys=True)
+
+    def get(self, keywords: List[str], payload_config: dict) -> Optional[pd.DataFrame]:
+        """Cached result of a request (None if not cached or expired)."""
+        key = self.make_key(keywords, payload_config)
+        now = time.time()
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT value FROM requests WHERE key = ? AND created > ?",
+                (key, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            con.execute("UPDATE requests SET accessed = ? WHERE key = ?", (now, key))
+
+        result = pickle.loads(row[0])
+        if result.shape[1] >= len(keywords):
+            # Columns are named after the keywords as requested
+            result.columns = list(keywords) + list(result.columns[len(keywords):])
+        return result
+
+    def put(self, keywords: List[str], payload_config: dict, result: pd.DataFrame):
+        """Cache the result of a request, evicting old results if needed.
+
+        Empty results aren't cached, so a rate limited or failed reply isn't
+        served until it expires.
+        """
+        if result.empty:
+            return
+        key = self.make_key(keywords, payload_config)
+        value = pickle.dumps(result, protocol=4)
+        now = time.time()
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO requests VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            con.execute("DELETE FROM requests WHERE created <= ?", (now - self.ttl,))
+
+            total = con.execute("SELECT SUM(size) FROM requests").fetchone()[0] or 0
+            if total > self.max_bytes:
+                evict = []
+                for evict_key, size in con.execute(
+                    "SELECT key, size FROM requests ORDER BY accessed"
+                ):
+                    if total <= self.max_bytes:
+                        break
+                    evict.append((evict_key,))
+                    total -= size
+                con.executemany("DELETE FROM requests WHERE key = ?", evict)
+
+    def backup(self, path: str):
+        """Write a consistent copy of the cache to `path` (e.g. to upload it)."""
+        with self._connect() as con:
+            dest = sqlite3.connect(path)
+            try:
+                con.backup(dest)
+            finally:
+                dest.close()
+
+
+def clone_gtab(gtab: "GTAB") -> "GTAB":
+    """Copy of `gtab` with its own Google Trends connection.
+
+    The anchor bank and rate limiter are shared with `gtab`, so the copy can
+    query from another thread.
+    """
+    clone = copy.copy(gtab)
+    clone.CONFIG = copy.deepcopy(gtab.CONFIG)
+    clone.pytrends = TrendReq(hl="en-US", **clone.CONFIG["CONN"])
+    return clone
+
+
+def make_thread_query(gtab: "GTAB") -> Callable[[str], pd.Series]:
+    """`gtab_query` using a copy of `gtab` in each thread (see `clone_gtab`)."""
+    local = threading.local()
+
+    def query(word: str) -> pd.Series:
+        if not hasattr(local, "gtab"):
+            local.gtab = clone_gtab(gtab)
+        return gtab_query(word, local.gtab)
+
+    return query
+
+
+T = TypeVar("T")
+
+
+def query_concurrently(
+    words: Iterable[str], query: Callable[[str], T], n_threads: int = 8
+) -> Iterator[Tuple[str, T]]:
+    """Run `query` on `words` in a thread pool.
+
+    Requests should be rate limited within `query` (e.g. by a `TokenBucket`
+    shared by the `GTAB` of each thread) so that run time is bound by the
+    rate limit rather than by request latency.
+
+    Yields:
+        `(word, result)` as queries complete
+
+    Raises:
+        The first exception raised by `query`, after cancelling the queries
+        that have not started
+    """
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        futures = {executor.submit(query, word): word for word in words}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
 def set_gtab_timeframe(gtab: GTAB_, anchor_period: str) -> str:
     """Set options on `gtab` returning name of anchorbank."""
     gtab.set_options(pytrends_config={"geo": "GB", "timeframe": anchor_period})
@@ -202,6 +391,10 @@ class GTAB:
 
         self.active_gtab = None
         self.pytrends = TrendReq(hl="en-US", **self.CONFIG["CONN"])
+        # Shared `TokenBucket` used instead of sleeping between requests
+        self.rate_limiter = None
+        # `RequestCache` consulted before querying Google
+        self.request_cache = None
 
         # sets default anchorbank
         if not self.from_cli:
@@ -221,22 +414,36 @@ class GTAB:
         return "_".join([f"{k}={v}" for k, v in self.CONFIG["PYTRENDS"].items()])
 
     def _query_google(self, keywords=["Keywords"]):
-        time.sleep(self.CONFIG["GTAB"]["sleep"])
         if type(keywords) == str:
             keywords = [keywords]
 
         if len(keywords) > 5:
             raise ValueError("Number of keywords must be at most than 5.")
 
+        if self.request_cache is not None:
+            ret = self.request_cache.get(keywords, self.CONFIG["PYTRENDS"])
+            if ret is not None:
+                return ret
+
+        if self.rate_limiter is None:
+            time.sleep(self.CONFIG["GTAB"]["sleep"])
+        else:
+            self.rate_limiter.acquire()
+
         self.pytrends.build_payload(kw_list=keywords, **self.CONFIG["PYTRENDS"])
         ret = self.pytrends.interest_over_time()
+
+        # Empty replies (e.g. when rate limited) aren't cached so they're retried
+        if self.request_cache is not None:
+            self.request_cache.put(keywords, self.CONFIG["PYTRENDS"], ret)
         return ret
 
     def _is_not_blacklisted(self, keyword):
         return keyword not in self.CONFIG["BLACKLIST"]
 
     def _check_keyword(self, keyword):
-        time.sleep(self.CONFIG["GTAB"]["sleep"])
+        if self.rate_limiter is None:
+            time.sleep(self.CONFIG["GTAB"]["sleep"])
         try:
             rez = self._query_google(keywords=keyword)
             return self._is_not_blacklisted(keyword) and not rez.empty
@@ -9,6 +9,8 @@ TODO: Run remotely and in isolated environment. Currently dependency on
 import logging
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
 from cytoolz.curried import curry, pipe
 from metaflow import FlowSpec, Parameter, step, current, namespace
 from jacc_hammer.fuzzy_hash import (
@@ -21,6 +23,15 @@ from jacc_hammer.name_clean import preproc_names
 from jacc_hammer.top_matches import get_top_matches_chunked
 
 from sg_covid_impact import project_dir
+from sg_covid_impact.flows.jacchammer.utils import (
+    diff_previous_run,
+    make_block_comparisons,
+    make_first_token_keys,
+    make_postcode_keys,
+    partition_comparisons,
+    restrict_comparisons,
+)
+from sg_covid_impact.queries.glass_house import get_top_matches
 from sg_covid_impact.utils.metaflow import flow_getter
 
 
@@ -41,6 +52,14 @@ class GlassHouseMatch(FlowSpec):
         type=int,
     )
 
+    previous_run_id = Parameter(
+        "previous-run-id",
+        help="Metaflow run ID of a previous GlassHouseMatch run. If given, only "
+        "match names that changed since that run and merge with its matches",
+        default=None,
+        type=int,
+    )
+
     test_mode = Parameter(
         "test_mode",
         help="Whether to run in test mode (on a small subset of data)",
@@ -48,6 +67,21 @@ class GlassHouseMatch(FlowSpec):
         default=True,
     )
 
+    n_blocks = Parameter(
+        "n-blocks",
+        help="Number of partitions of the comparisons to match in parallel",
+        type=int,
+        default=8,
+    )
+
+    blocking = Parameter(
+        "blocking",
+        help="Only compare names with the same `postcode` district or "
+        "`first_token` (`none` to compare all names)",
+        type=str,
+        default="none",
+    )
+
     @step
     def start(self):
         """ Load raw data """
@@ -91,20 +125,76 @@ class GlassHouseMatch(FlowSpec):
             .name
         )
 
+        if self.blocking == "postcode":
+            self.postcodes_y = glass.organisationaddress.merge(
+                glass.address, on="address_id"
+            )[["org_id", "postcode"]].rename(columns={"org_id": "id"})
+            self.postcodes_x = ch.organisationaddress.merge(
+                ch.address, on="address_id"
+            )[["company_number", "postcode"]].rename(columns={"company_number": "id"})
+        elif self.blocking not in ("none", "first_token"):
+            raise ValueError(f"`blocking` value {self.blocking} not valid")
+
         self.next(self.process_names)
 
     @step
     def process_names(self):
         """ Pre-process names """
-        self.names = [
-            name.pipe(preproc_names).dropna()
-            for i, name in enumerate([self.names_x, self.names_y])
+        processed_names = [
+            name.pipe(preproc_names) for name in [self.names_x, self.names_y]
         ]
-        self.next(self.match)
+        self.names = [name.dropna() for name in processed_names]
+        names_x, names_y = self.names
+
+        if self.blocking == "none":
+            comparisons = [(np.arange(len(names_x)), np.arange(len(names_y)))]
+            self.block_stats = None
+        else:
+            if self.blocking == "postcode":
+                keys_x = make_postcode_keys(names_x, self.postcodes_x)
+                keys_y = make_postcode_keys(names_y, self.postcodes_y)
+            else:
+                keys_x = make_first_token_keys(names_x)
+                keys_y = make_first_token_keys(names_y)
+            comparisons, self.block_stats = make_block_comparisons(
+                keys_x, keys_y, len(names_x), len(names_y)
+            )
+
+        if self.previous_run_id is not None:
+            logging.info(f"Matching changes since run {self.previous_run_id}")
+            previous = flow_getter("GlassHouseMatch", run_id=self.previous_run_id)
+            new_x, new_y, self.previous_matches = diff_previous_run(
+                self.names_x,
+                self.names_y,
+                previous.names_x,
+                previous.names_y,
+                previous.company_numbers,
+            )
+            # Positions in the pre-processed names
+            comparisons = restrict_comparisons(
+                comparisons,
+                new_x[processed_names[0].notna().values],
+                new_y[processed_names[1].notna().values],
+            )
+        else:
+            self.previous_matches = None
+
+        # Partitions of the comparisons to match separately
+        self.blocks = partition_comparisons(comparisons, self.n_blocks)
+        self.next(self.match, foreach="blocks")
 
     @step
     def match(self):
-        """ The core fuzzy matching algorithm """
+        """ The core fuzzy matching algorithm, for a partition of comparisons
+
+        Similarities of each comparison are stored in their own shard and
+        reduced to the top matches of the partition, with `x` and `y`
+        indexing into all names.
+        """
+        self.block = self.input
+        block_dir = self.tmp_dir / f"block_{self.index}"
+        block_dir.mkdir(parents=True, exist_ok=True)
+
         cos_config = Cos_config()
         fuzzy_config = Fuzzy_config(num_perm=128)
         match_config = dict(
@@ -112,25 +202,55 @@ class GlassHouseMatch(FlowSpec):
             chunksize=100,
             cos_config=cos_config,
             fuzzy_config=fuzzy_config,
-            tmp_dir=self.tmp_dir,
+            tmp_dir=block_dir,
         )
-        self.f_fuzzy_similarities = f"{self.tmp_dir}/fuzzy_similarities"
-        out = pipe(
-            list(map(lambda x: x.values, self.names)),
-            curry(match_names_stream, **match_config),
-            curry(stream_sim_chunks_to_hdf, fout=self.f_fuzzy_similarities),
+        chunksize = 1e7
+        names_x, names_y = self.names
+
+        self.f_fuzzy_similarities = []
+        block_top_matches = []
+        for i, (x_positions, y_positions) in enumerate(self.block):
+            f_fuzzy_similarities = f"{block_dir}/fuzzy_similarities_{i}"
+            out = pipe(
+                [names_x.values[x_positions], names_y.values[y_positions]],
+                curry(match_names_stream, **match_config),
+                curry(stream_sim_chunks_to_hdf, fout=f_fuzzy_similarities),
+            )
+            assert out == f_fuzzy_similarities, out
+            self.f_fuzzy_similarities.append(f_fuzzy_similarities)
+
+            block_top_matches.append(
+                get_top_matches_chunked(
+                    f_fuzzy_similarities, chunksize=chunksize, tmp_dir=block_dir
+                ).assign(
+                    x=lambda x: x_positions[x.x.values],
+                    y=lambda x: y_positions[x.y.values],
+                )
+            )
+
+        self.block_top_matches = (
+            get_top_matches(pd.concat(block_top_matches), key="y", score="sim_mean")
+            if block_top_matches
+            else pd.DataFrame(columns=["x", "y", "sim_mean"])
         )
-        assert out == self.f_fuzzy_similarities, out
+
         self.next(self.find_top_matches)
 
     @step
-    def find_top_matches(self):
-        """ Find the top matches for each organisation """
-        chunksize = 1e7
-
-        self.top_matches = get_top_matches_chunked(
-            self.f_fuzzy_similarities, chunksize=chunksize, tmp_dir=self.tmp_dir
+    def find_top_matches(self, inputs):
+        """ Find the top matches for each organisation across blocks """
+        self.merge_artifacts(
+            inputs, exclude=["block", "f_fuzzy_similarities", "block_top_matches"]
         )
+        self.f_fuzzy_similarities = [
+            f for input in inputs for f in input.f_fuzzy_similarities
+        ]
+
+        self.top_matches = get_top_matches(
+            pd.concat([input.block_top_matches for input in inputs]),
+            key="y",
+            score="sim_mean",
+        ).reset_index(drop=True)
 
         self.next(self.end)
 
@@ -153,6 +273,15 @@ class GlassHouseMatch(FlowSpec):
             .drop(["x", "y"], axis=1)
         )
 
+        if self.previous_matches is not None:
+            # Keep the previous match of unchanged organisations unless a
+            # new or changed company name matches them better
+            self.company_numbers = get_top_matches(
+                pd.concat([self.previous_matches, self.company_numbers]),
+                key="org_id",
+                score="sim_mean",
+            ).reset_index(drop=True)
+
 
 if __name__ == "__main__":
     logging.basicConfig(
@@ -14,9 +14,13 @@ if __name__ == "__main__":
 
     cmd_params = {
         "--test_mode": str(config_["params"]["test_mode"]),
+        "--n-blocks": str(config_["params"]["n_blocks"]),
+        "--blocking": str(config_["params"]["blocking"]),
         "--CH-flow-id": str(CH_flow_id),
         "--glass-flow-id": str(glass_flow_id),
     }
+    if config_["params"]["incremental"]:
+        cmd_params["--previous-run-id"] = str(config_["run_id"])
     flow_file = Path(jacchammer.__file__).resolve()
     run_id = execute_flow(
         flow_file,
@@ -0,0 +1,220 @@
+# %%
+"""Utility functions for GlassHouseMatch flow.
+
+Candidate pairs of names are described as "comparisons": a pair of arrays
+with the positions of the `x` (Companies House) and `y` (Glass) names to
+fuzzy match against each other.
+
+Blocking restricts comparisons to names sharing a key (e.g. postcode
+district). Names without a key shared with the other side fall back to a
+comparison against all names of the other side.
+"""
+import logging
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+Comparison = Tuple[np.ndarray, np.ndarray]
+
+
+def postcode_district(postcodes: pd.Series) -> pd.Series:
+    """Postcode district (outward code) of `postcodes`, e.g. "EH1 1AB" -> "EH1"."""
+    return (
+        postcodes.str.upper()
+        .str.replace(" ", "", regex=False)
+        .str.slice(0, -3)
+        .replace("", np.nan)
+    )
+
+
+def make_postcode_keys(names: pd.Series, postcodes: pd.DataFrame) -> pd.DataFrame:
+    """Postcode district blocking keys for the positions of `names`.
+
+    Args:
+        names: Names indexed by organisation id.
+        postcodes: Organisation id (`id`) and `postcode`, one row per address.
+
+    Returns:
+        `position` in `names` and blocking `key`, one row per (position, key)
+    """
+    positions = pd.DataFrame(
+        {"id": names.index.values, "position": np.arange(len(names))}
+    )
+    return (
+        positions.merge(
+            postcodes.assign(key=lambda x: postcode_district(x.postcode)),
+            on="id",
+        )[["position", "key"]]
+        .dropna()
+        .drop_duplicates()
+    )
+
+
+def make_first_token_keys(names: pd.Series) -> pd.DataFrame:
+    """First token blocking keys for the positions of (pre-processed) `names`.
+
+    Returns:
+        `position` in `names` and blocking `key`, one row per position
+    """
+    return pd.DataFrame(
+        {"position": np.arange(len(names)), "key": names.str.split().str[0].values}
+    ).dropna()
+
+
+def make_block_comparisons(
+    keys_x: pd.DataFrame, keys_y: pd.DataFrame, n_x: int, n_y: int
+) -> Tuple[List[Comparison], pd.DataFrame]:
+    """Comparisons restricted to blocks of names sharing a key.
+
+    Names without a key shared with the other side are compared with all
+    the names of the other side.
+
+    Args:
+        keys_x: Blocking keys of `x` names (see `make_postcode_keys`).
+        keys_y: Blocking keys of `y` names.
+        n_x: Number of `x` names.
+        n_y: Number of `y` names.
+
+    Returns:
+        Comparisons and number of names and pairs in each block
+    """
+    shared_keys = set(keys_x.key) & set(keys_y.key)
+    keys_x = keys_x.loc[keys_x.key.isin(shared_keys)]
+    keys_y = keys_y.loc[keys_y.key.isin(shared_keys)]
+
+    x_blocks = keys_x.groupby("key").position.apply(np.unique)
+    y_blocks = keys_y.groupby("key").position.apply(np.unique)
+    comparisons = [(x_blocks[key], y_blocks[key]) for key in x_blocks.index]
+
+    block_stats = pd.DataFrame(
+        {
+            "key": x_blocks.index,
+            "n_x": [len(x) for x, _ in comparisons],
+            "n_y": [len(y) for _, y in comparisons],
+        }
+    ).assign(n_pairs=lambda x: x.n_x * x.n_y)
+
+    # Fall back to full comparison for names that are not blocked
+    blocked_y = np.unique(keys_y.position)
+    unblocked_x = np.setdiff1d(np.arange(n_x), keys_x.position)
+    unblocked_y = np.setdiff1d(np.arange(n_y), blocked_y)
+    fallback = [
+        (np.arange(n_x), unblocked_y),
+        (unblocked_x, blocked_y),
+    ]
+    comparisons += [(x, y) for x, y in fallback if len(x) > 0 and len(y) > 0]
+
+    n_pairs = sum(len(x) * len(y) for x, y in comparisons)
+    logger.info(
+        f"{len(block_stats)} blocks: median size {block_stats.n_x.median()} x "
+        f"{block_stats.n_y.median()}, max pairs {block_stats.n_pairs.max()}"
+    )
+    logger.info(
+        f"{len(unblocked_x)} x and {len(unblocked_y)} y names not blocked. "
+        f"{n_pairs} candidate pairs ({n_pairs / (n_x * n_y):.2%} of all pairs)"
+    )
+    return comparisons, block_stats
+
+
+def partition_comparisons(
+    comparisons: List[Comparison], n_partitions: int
+) -> List[List[Comparison]]:
+    """Split `comparisons` into `n_partitions` with similar numbers of pairs.
+
+    Comparisons with more pairs than a partition should hold are split into
+    blocks of `x` names first.
+    """
+    n_pairs = sum(len(x) * len(y) for x, y in comparisons)
+    max_pairs = max(int(np.ceil(n_pairs / n_partitions)), 1)
+
+    split_comparisons = []
+    for x, y in comparisons:
+        n_splits = int(np.ceil(len(x) * len(y) / max_pairs))
+        split_comparisons += [
+            (x_split, y) for x_split in np.array_split(x, n_splits) if len(x_split)
+        ]
+
+    # Greedily assign the largest comparisons to the emptiest partition
+    partitions = [[] for _ in range(n_partitions)]
+    partition_pairs = np.zeros(n_partitions)
+    for x, y in sorted(split_comparisons, key=lambda c: -len(c[0]) * len(c[1])):
+        i = partition_pairs.argmin()
+        partitions[i].append((x, y))
+        partition_pairs[i] += len(x) * len(y)
+
+    # Keep one (empty) partition when there is nothing to compare
+    return [partition for partition in partitions if partition] or [[]]
+
+
+def diff_names(names: pd.Series, previous_names: pd.Series) -> np.ndarray:
+    """Whether each (id, name) pair in `names` is missing from `previous_names`."""
+    current = pd.MultiIndex.from_arrays([names.index, names.values])
+    previous = pd.MultiIndex.from_arrays([previous_names.index, previous_names.values])
+    return ~current.isin(previous)
+
+
+def diff_previous_run(
+    names_x: pd.Series,
+    names_y: pd.Series,
+    previous_names_x: pd.Series,
+    previous_names_y: pd.Series,
+    previous_matches: pd.DataFrame,
+) -> Tuple[np.ndarray, np.ndarray, pd.DataFrame]:
+    """Find the names to match given the inputs and outputs of a previous run.
+
+    `y` names need matching (against all `x` names) if they are new, their
+    name changed, or their previous match was to a company whose names
+    changed. `x` names need matching (against the other `y` names) if they
+    are new or their name changed.
+
+    Args:
+        names_x: Companies House names indexed by `company_number`.
+        names_y: Glass names indexed by `org_id`.
+        previous_names_x: `names_x` of the previous run.
+        previous_names_y: `names_y` of the previous run.
+        previous_matches: `company_numbers` of the previous run.
+
+    Returns:
+        Whether each `x` name is new, whether each `y` name is new, and the
+        previous matches that are still valid
+    """
+    new_x = diff_names(names_x, previous_names_x)
+    new_y = diff_names(names_y, previous_names_y)
+
+    # Companies with a name that no longer exists
+    changed_companies = previous_names_x.index[
+        diff_names(previous_names_x, names_x)
+    ].unique()
+    invalid_orgs = previous_matches.loc[
+        lambda x: x.company_number.isin(changed_companies), "org_id"
+    ]
+    new_y = new_y | names_y.index.isin(invalid_orgs)
+
+    valid_matches = previous_matches.loc[
+        lambda x: x.org_id.isin(names_y.index[~new_y])
+    ]
+
+    logger.info(
+        f"{new_x.sum()} of {len(names_x)} x names and {new_y.sum()} of "
+        f"{len(names_y)} y names changed since previous run"
+    )
+    return new_x, new_y, valid_matches
+
+
+def restrict_comparisons(
+    comparisons: List[Comparison], new_x: np.ndarray, new_y: np.ndarray
+) -> List[Comparison]:
+    """Restrict `comparisons` to pairs involving a new `x` or `y` name.
+
+    Args:
+        comparisons: Comparisons of all names.
+        new_x: Whether each `x` name (by position) is new.
+        new_y: Whether each `y` name (by position) is new.
+    """
+    restricted = []
+    for x, y in comparisons:
+        restricted += [(x, y[new_y[y]]), (x[new_x[x]], y[~new_y[y]])]
+    return [(x, y) for x, y in restricted if len(x) > 0 and len(y) > 0]
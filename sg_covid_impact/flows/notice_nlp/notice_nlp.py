@@ -2,6 +2,7 @@
 """Tokenises and ngrams Covid notices."""
 import re
 import string
+from functools import partial
 from itertools import product
 from typing import Any, Dict, Iterable, List, Optional
 
@@ -15,6 +16,7 @@ from sg_covid_impact.getters.glass import get_notice
 from sg_covid_impact.nlp import (
     make_ngrams_v2,
     tokenize,
+    tokenize_parallel,
     _STOP_WORDS,
 )
 
@@ -78,6 +80,11 @@ def token_converter(tokens: Iterable[str]) -> Iterable[str]:
     return map(convert, tokens)
 
 
+def lemmatise(document: List[str], lemmatiser: WordNetLemmatizer) -> List[str]:
+    """Lemmatise tokens."""
+    return [lemmatiser.lemmatize(word) for word in document]
+
+
 @t.curry
 def filter_frequency(
     documents: List[str], kwargs: Optional[Dict[str, Any]] = None
@@ -140,7 +147,10 @@ class NoticeTokeniseFlow(FlowSpec):
         notice_tokens = t.pipe(
             notices.snippet.values,
             # Tokenise and filter
-            t.map(t.compose(list, pre_token_filter, token_converter, tokenize_)),
+            t.curry(
+                tokenize_parallel,
+                tokenizer=t.compose(list, pre_token_filter, token_converter, tokenize_),
+            ),
             list,
             # Filter low frequency terms (want to keep high frequency terms)
             filter_frequency(kwargs={"no_above": 1}),
@@ -148,7 +158,9 @@ class NoticeTokeniseFlow(FlowSpec):
             # N-gram
             t.curry(make_ngrams_v2, n=self.n_gram),
             # Lemmatise
-            t.map(lambda document: [lemmatiser.lemmatize(word) for word in document]),
+            t.curry(
+                tokenize_parallel, tokenizer=partial(lemmatise, lemmatiser=lemmatiser)
+            ),
             # Filter ngrams: combination of stopwords, e.g. `of_the`
             t.map(t.compose(list, post_token_filter)),
             list,
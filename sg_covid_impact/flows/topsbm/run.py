@@ -8,17 +8,15 @@ from pathlib import Path
 from research_daps.flows.topsbm import topsbm
 
 from sg_covid_impact import config
-from sg_covid_impact.getters.glass import get_notice_tokens
+from sg_covid_impact.getters.glass import get_notice_corpus
 from sg_covid_impact.utils.metaflow import update_model_config, execute_flow
 
 
 def generate_documents(subsample_factor: float) -> Path:
     """Generate notice tokens."""
-    docs = {
-        k: v
-        for k, v in get_notice_tokens().items()
-        if random.random() < subsample_factor
-    }
+    corpus = get_notice_corpus()
+    sample_ids = [k for k in corpus.ids() if random.random() < subsample_factor]
+    docs = corpus.subset(sample_ids).to_dict()
 
     path = Path("notice_documents_all.json").resolve()
     with open(path, "w") as f:
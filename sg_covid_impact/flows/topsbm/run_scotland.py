@@ -7,7 +7,7 @@ from pathlib import Path
 from research_daps.flows.topsbm import topsbm
 
 from sg_covid_impact import config
-from sg_covid_impact.getters.glass import get_notice_tokens
+from sg_covid_impact.getters.glass import get_notice_corpus
 from sg_covid_impact.queries.geography import get_notice_ids_for_scotland
 from sg_covid_impact.utils.metaflow import update_model_config, execute_flow
 
@@ -16,7 +16,7 @@ def generate_documents() -> Path:
     """Generate notice tokens for organisations in Scotland."""
     scottish_notice_ids = get_notice_ids_for_scotland()
 
-    docs = {k: v for k, v in get_notice_tokens().items() if k in scottish_notice_ids}
+    docs = get_notice_corpus().subset(scottish_notice_ids).to_dict()
 
     path = Path("notice_documents_scotland.json").resolve()
     with open(path, "w") as f:
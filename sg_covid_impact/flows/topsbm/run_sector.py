@@ -9,7 +9,7 @@ from research_daps.flows.topsbm import topsbm_grouped
 
 import sg_covid_impact
 from sg_covid_impact import config
-from sg_covid_impact.getters.glass import get_notice_tokens
+from sg_covid_impact.getters.glass import get_notice_corpus
 from sg_covid_impact.queries.sector import get_notice_ids_for_SIC_section
 from sg_covid_impact.sic import section_code_lookup
 from sg_covid_impact.utils.metaflow import update_model_config, execute_flow
@@ -23,6 +23,7 @@ def generate_documents(path: Path, match_threshold: int, max_rank: int) -> None:
     """Generate notice tokens broken up by SIC section."""
     valid_sections = list(set(section_code_lookup().values()))
 
+    corpus = get_notice_corpus()
     docs = []
     for section in valid_sections:
         logger.info(f"Getting notice tokens for SIC section {section}")
@@ -35,9 +36,7 @@ def generate_documents(path: Path, match_threshold: int, max_rank: int) -> None:
             logging.warning(f"Not enough documents, skipping SIC section {section}")
             continue
 
-        section_docs = {
-            k: v for k, v in get_notice_tokens().items() if k in section_notice_ids
-        }
+        section_docs = corpus.subset(section_notice_ids).to_dict()
         docs.append([section, section_docs])
 
     with open(path, "w") as f:
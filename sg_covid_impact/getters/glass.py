@@ -1,18 +1,22 @@
 # %%
 """Data getters for Glass business website data."""
 import logging
+from pathlib import Path
 from typing import Dict, List
 
 import pandas as pd
 from metaflow import namespace
 
 from sg_covid_impact.utils.metaflow import flow_getter, cache_getter_fn
+from sg_covid_impact.utils.token_corpus import TokenCorpus, write_token_corpus
 import sg_covid_impact
 
 
 logger = logging.getLogger(__name__)
 namespace(None)
 
+CORPUS_DIR = Path(f"{sg_covid_impact.project_dir}/data/interim/token_corpora")
+
 
 def run_id() -> int:
     """Get `run_id` for flow
@@ -88,3 +92,19 @@ def get_notice_tokens() -> Dict[str, List[str]]:
 
     run_id = sg_covid_impact.config["flows"]["notice_tokens"]["run_id"]
     return flow_getter("NoticeTokeniseFlow", run_id=run_id).docs
+
+
+def get_notice_corpus() -> TokenCorpus:
+    """Tokenised Covid notices as a memory-mapped corpus.
+
+    The corpus is written from `get_notice_tokens` the first time it is
+    requested for a `NoticeTokeniseFlow` run and read from disk afterwards.
+    """
+
+    run_id = sg_covid_impact.config["flows"]["notice_tokens"]["run_id"]
+    path = CORPUS_DIR / f"notice_tokens_{run_id}"
+    if (path / "doc_ids.json").exists():
+        return TokenCorpus(path)
+
+    logger.info(f"Writing notice token corpus to {path}")
+    return write_token_corpus(get_notice_tokens(), path)
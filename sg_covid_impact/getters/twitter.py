@@ -3,10 +3,14 @@ import json
 import os
 from itertools import chain
 from pathlib import Path
-from typing import Any, List, Dict
+from typing import Any, Iterable, List, Dict, Optional
 
 from dotenv import find_dotenv, load_dotenv
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import metaflow as mf
 import toolz.curried as t
 
@@ -14,9 +18,8 @@ from sg_covid_impact.getters.glass import get_organisation
 from sg_covid_impact import config
 from sg_covid_impact import project_dir
 from sg_covid_impact.twitter.match import (
-    filter_accounts,
-    extract_twitter_id,
     build_blacklist,
+    resolve_twitter_ids,
     user_website_lookup,
 )
 from sg_covid_impact.utils.metaflow import cache_getter_fn
@@ -32,26 +35,68 @@ load_dotenv(find_dotenv())
 RUN_ID: int = config["flows"]["webex"]["run_id"]
 
 
-def get_users() -> List[UserInfo]:
-    """Load twitter user data."""
-    path = (
-        Path(os.environ.get("temp_dir") or f"{project_dir}/data/interim")
-        / "twitter"
-        / "users.json"
-    )
-    with path.open() as f:
-        return json.load(f)
+def _twitter_dir() -> Path:
+    """Directory with the processed twitter data (see `twitter/filter.py`)."""
+    return Path(os.environ.get("temp_dir") or f"{project_dir}/data/interim") / "twitter"
 
 
-def get_tweets() -> List[Tweets]:
-    """Load twitter tweet data."""
-    path = (
-        Path(os.environ.get("temp_dir") or f"{project_dir}/data/interim")
-        / "twitter"
-        / "tweets.json"
-    )
-    with path.open() as f:
-        return json.load(f)
+def get_users(screen_names: Optional[Iterable[str]] = None) -> List[UserInfo]:
+    """Load twitter user data.
+
+    Args:
+        screen_names: Lower-cased screen names of users to load. If None, load
+            all users.
+    """
+    with (_twitter_dir() / "users.jsonl").open("rb") as f:
+        if screen_names is None:
+            return [json.loads(line) for line in f]
+
+        with (_twitter_dir() / "user_index.json").open() as f_index:
+            index = json.load(f_index)
+        offsets = sorted(
+            chain.from_iterable(index.get(name, []) for name in set(screen_names))
+        )
+
+        users = []
+        for offset in offsets:
+            f.seek(offset)
+            users.append(json.loads(f.readline()))
+        return users
+
+
+def get_tweets(
+    columns: Optional[List[str]] = None, users: Optional[Iterable[UserHandle]] = None
+) -> pd.DataFrame:
+    """Load twitter tweet data.
+
+    Args:
+        columns: Columns to read. If None, read all columns.
+        users: Lower-cased screen names to read tweets of. If None, read all.
+            Only the row groups with their tweets are read.
+    """
+    path = _twitter_dir() / "tweets"
+    if users is None:
+        return ds.dataset(path, format="parquet").to_table(columns=columns).to_pandas()
+
+    users = set(users)
+    read_columns = None if columns is None else list({*columns, "user_lower"})
+    index = pd.read_parquet(_twitter_dir() / "tweet_index.parquet").loc[
+        lambda x: x.user_lower.isin(users)
+    ]
+    tables = [
+        pq.ParquetFile(path / file).read_row_groups(
+            sorted(file_index.row_group.unique()), columns=read_columns
+        )
+        for file, file_index in index.groupby("file")
+    ]
+    if len(tables) == 0:
+        schema = ds.dataset(path, format="parquet").schema
+        return schema.empty_table().select(columns or schema.names).to_pandas()
+
+    table = pa.concat_tables(tables)
+    # Row groups also have tweets of other users
+    table = table.filter(pc.is_in(table["user_lower"], pa.array(users, pa.string())))
+    return table.select(columns or table.schema.names).to_pandas()
 
 
 @cache_getter_fn
@@ -70,13 +115,7 @@ def get_matches(run_id: int = RUN_ID) -> Dict[str, UserHandle]:
 
     lookup = user_website_lookup(get_users())
 
-    return t.pipe(
-        matches.items(),
-        t.map(lambda match: filter_accounts(match, blacklist)),
-        t.map(lambda match: extract_twitter_id(match, lookup)),
-        dict,
-        t.valfilter(lambda v: v is not None),
-    )
+    return resolve_twitter_ids(matches, blacklist, lookup)
 
 
 @cache_getter_fn
@@ -99,13 +138,11 @@ def get_glass_twitter_accounts() -> pd.DataFrame:
 def get_glass_tweets() -> pd.DataFrame:
     glass_twitter_accounts = get_glass_twitter_accounts().drop("website", axis=1)
 
-    glass_twitter_account_set = glass_twitter_accounts.user.pipe(set)
-    tweets = t.pipe(
-        get_tweets(),
-        t.filter(lambda x: x[0]["user"].lower() in glass_twitter_account_set),
-        chain.from_iterable,
-        pd.DataFrame,
-    ).assign(user=lambda x: x.user.str.lower())
+    tweets = (
+        get_tweets(users=glass_twitter_accounts.user)
+        .assign(user=lambda x: x.user_lower)
+        .drop("user_lower", axis=1)
+    )
 
     # TODO: what is the matching loss here? WHy does it exist?
     return glass_twitter_accounts.merge(tweets, on="user", how="inner").assign(
@@ -121,11 +158,8 @@ def get_glass_twitter_user_info() -> pd.DataFrame:
         .rename(columns={"user": "screen_name"})
     )
 
-    glass_twitter_account_set = glass_twitter_accounts.screen_name.pipe(set)
-    users = t.pipe(
-        get_users(),
-        t.filter(lambda x: x["screen_name"].lower() in glass_twitter_account_set),
-        pd.DataFrame,
+    users = pd.DataFrame(
+        get_users(screen_names=glass_twitter_accounts.screen_name)
     ).assign(screen_name=lambda x: x.screen_name.str.lower())
 
     # TODO: what is the matching loss here? WHy does it exist?
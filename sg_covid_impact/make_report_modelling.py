@@ -1,7 +1,6 @@
 # Models relations between variables of interest
 import yaml
 import altair as alt
-import pandas as pd
 from sg_covid_impact.utils.altair_save_utils import (
     google_chrome_driver_setup,
     save_altair,
@@ -14,8 +13,8 @@ from sg_covid_impact.modelling import (
     make_exposure_share_variable,
     plot_variable_correlations,
     make_regression_table,
-    fit_regression,
-    extract_model_results,
+    make_model_specs,
+    fit_model_grid,
     plot_model_coefficients,
     make_tidy_agg_table,
     plot_correlation_evolution,
@@ -34,16 +33,9 @@ import sg_covid_impact
 
 project_dir = sg_covid_impact.project_dir
 
-alt.data_transformers.disable_max_rows()
-driver = google_chrome_driver_setup()
-
 FIG_PATH = f"{project_dir}/figures/scotland"
 # make_fig_path(FIG_PATH)
 
-with open(f"{project_dir}/sg_covid_impact/model_config.yaml", "r") as infile:
-    out_params = yaml.safe_load(infile)["modelling"]
-nuts1_focus = out_params["nuts1"]
-
 # Lookups etc
 _SHORT_VAR_NAMES = {
     "% with NVQ4+ - aged 16-64": "% tertiary",
@@ -86,73 +78,78 @@ secondary_vars = _SEC_KEEP
 # Reading, processing, plotting and modelling
 ########
 
-# Make variables
-exp = make_exposure_share_variable()  # Exposure share
-div = make_div_share_variable()  # low diversification share
-cl = make_claimant_count_variable()  # Claimant count
-secondary = make_secondary_variables()  # Secondary
-
-# Bivariate correlations
-# We will use this table for regressions and correlations
-reg_table = make_regression_table(cl, exp, div, secondary)
-tidy_agg_df = make_tidy_agg_table(
-    reg_table, exp_vars, out_vars, secondary_vars, nuts_focus=nuts1_focus
-)
-bivariate_scatters = plot_variable_correlations(tidy_agg_df)
-save_altair(bivariate_scatters, "bivariate_scatters", driver=driver, path=FIG_PATH)
-export_chart(bivariate_scatters, "bivariate_scatters")
-
-correlation_evolution = plot_correlation_evolution(reg_table, nuts_focus=nuts1_focus)
-
-# Correlation table
-scot_reg_table = reg_table.loc[[x[0] != "S" for x in reg_table["geo_cd"]]]
-
-corr_all = make_correlation_plot(scot_reg_table)
-save_altair(corr_all, "correlation_table", driver=driver, path=FIG_PATH)
-export_chart(corr_all, "correlation_table")
-
-# Regression
-mods = {}
-
-# For each dependent variable we fit a model
-for dep in ["cl_count", "cl_count_norm"]:
-    for indep in ["exp", "div"]:
-        mods[f"{dep}_{indep}"] = fit_regression(reg_table, dep, indep)
-
-# Extract model results and concatenate
-model_results = pd.concat([extract_model_results(v, name=k) for k, v in mods.items()])
-
-# Plot model
-model_selected = (
-    model_results.reset_index(drop=False).loc[model_results.index.isin(my_vars)]
-).reset_index(drop=True)
-
-# Process model variables
-model_selected["pred"] = [
-    "exp share" if "exposure" in x else "low div share" for x in model_selected["index"]
-]
-model_selected["temporal"] = [
-    "lagged" if "lagged" in x else "present" for x in model_selected["index"]
-]
-
-# Create plot with model coefficients
-regression_plot = plot_model_coefficients(model_selected)
-
-# # Combine with correlation evolution plot above
-# modelling_results = alt.vconcat(correlation_evolution, regression_plot).resolve_scale(
-#     color="independent"
-# )
-
-save_altair(regression_plot, "modelling_results", driver=driver, path=FIG_PATH)
-export_chart(regression_plot, "modelling_results")
-
-# Conclude by exploring predictions based on current data
-
-predicted_actual = combine_predicted_actual(
-    make_predicted_values(mods, exp, div, secondary), cl
-)
-
-pred_ch = plot_predictions(predicted_actual.query("nuts1=='Scotland'"))
-
-save_altair(pred_ch, "predicted_outputs", driver=driver, path=FIG_PATH)
-export_chart(pred_ch, "predicted_outputs")
+# Guarded as `fit_model_grid` starts worker processes that re-import this module
+if __name__ == "__main__":
+    alt.data_transformers.disable_max_rows()
+    driver = google_chrome_driver_setup()
+
+    with open(f"{project_dir}/sg_covid_impact/model_config.yaml", "r") as infile:
+        out_params = yaml.safe_load(infile)["modelling"]
+    nuts1_focus = out_params["nuts1"]
+
+    # Make variables
+    exp = make_exposure_share_variable()  # Exposure share
+    div = make_div_share_variable()  # low diversification share
+    cl = make_claimant_count_variable()  # Claimant count
+    secondary = make_secondary_variables()  # Secondary
+
+    # Bivariate correlations
+    # We will use this table for regressions and correlations
+    reg_table = make_regression_table(cl, exp, div, secondary)
+    tidy_agg_df = make_tidy_agg_table(
+        reg_table, exp_vars, out_vars, secondary_vars, nuts_focus=nuts1_focus
+    )
+    bivariate_scatters = plot_variable_correlations(tidy_agg_df)
+    save_altair(bivariate_scatters, "bivariate_scatters", driver=driver, path=FIG_PATH)
+    export_chart(bivariate_scatters, "bivariate_scatters")
+
+    correlation_evolution = plot_correlation_evolution(
+        reg_table, nuts_focus=nuts1_focus
+    )
+
+    # Correlation table
+    scot_reg_table = reg_table.loc[[x[0] != "S" for x in reg_table["geo_cd"]]]
+
+    corr_all = make_correlation_plot(scot_reg_table)
+    save_altair(corr_all, "correlation_table", driver=driver, path=FIG_PATH)
+    export_chart(corr_all, "correlation_table")
+
+    # Regression
+    # For each dependent variable and focus predictor we fit a model
+    mods, model_results = fit_model_grid(reg_table, make_model_specs())
+
+    # Plot model
+    model_selected = model_results.loc[
+        model_results["index"].isin(my_vars)
+    ].reset_index(drop=True)
+
+    # Process model variables
+    model_selected["pred"] = [
+        "exp share" if "exposure" in x else "low div share"
+        for x in model_selected["index"]
+    ]
+    model_selected["temporal"] = [
+        "lagged" if "lagged" in x else "present" for x in model_selected["index"]
+    ]
+
+    # Create plot with model coefficients
+    regression_plot = plot_model_coefficients(model_selected)
+
+    # # Combine with correlation evolution plot above
+    # modelling_results = alt.vconcat(
+    #     correlation_evolution, regression_plot
+    # ).resolve_scale(color="independent")
+
+    save_altair(regression_plot, "modelling_results", driver=driver, path=FIG_PATH)
+    export_chart(regression_plot, "modelling_results")
+
+    # Conclude by exploring predictions based on current data
+
+    predicted_actual = combine_predicted_actual(
+        make_predicted_values(mods, exp, div, secondary), cl
+    )
+
+    pred_ch = plot_predictions(predicted_actual.query("nuts1=='Scotland'"))
+
+    save_altair(pred_ch, "predicted_outputs", driver=driver, path=FIG_PATH)
+    export_chart(pred_ch, "predicted_outputs")
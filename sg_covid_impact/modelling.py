@@ -1,8 +1,12 @@
 # Functions from Scottish modelling
 
 import os
+import hashlib
 import logging
 import datetime
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import networkx as nx
 import pandas as pd
 import numpy as np
 import altair as alt
@@ -30,11 +34,15 @@ from sg_covid_impact.diversification import (
     extract_sectors,
     extract_network,
     make_diversification_options,
-    make_sector_space_base,
+    make_sector_space_graph,
 )
 
 
 import statsmodels.api as sm
+from statsmodels.regression.linear_model import (
+    RegressionResults,
+    RegressionResultsWrapper,
+)
 
 project_dir = sg_covid_impact.project_dir
 
@@ -67,41 +75,20 @@ def make_local_exposure_table(exposures_ranked):
     return exposure_lad_codes
 
 
-def make_exposure_share_variable(exposure_thres=7):
-    """Extracts exposure shares by LAD
-    Args:
-        exposure_thres (int): exposure ranking
+def make_threshold_inputs():
+    """Calculates the inputs to the exposure and diversification share
+    variables that don't depend on any thresholds
+    Returns:
+        dict with sector exposure rankings, the division - month exposure
+        lookup, employment by LAD and exposure ranking, local exposure shares
+        and the predicted division probabilities for Glass companies
     """
-    logging.info("Calculating sector exposure")
-    exposures_ranked = calculate_sector_exposure()[0]
-
-    logging.info("Calculating local exposure shares")
-    exposure_lad_codes = make_local_exposure_table(exposures_ranked)
-
-    logging.info(f"Calculating high exposure shares level {exposure_thres}")
-    exposure_high = (
-        make_high_exposure(exposure_lad_codes, geo="geo_cd", level=exposure_thres)
-        .assign(variable="exposure_share")
-        .rename(columns={"share": "value"})
-    )
-
-    return exposure_high
-
-
-def make_div_share_variable(exposure_level=7, div_level=3):
-    """Calculates the share of employment in a low diversification sector
-    Args:
-        exposure_level (int): min threshold for high exposure
-        div_leve (int): min threshold for low diversification
-    """
-
     _DIVISION_NAME_LOOKUP = extract_sic_code_description(
         load_sic_taxonomy(), "Division"
     )
 
     logging.info("Calculating sector exposure")
     exposures_ranked = calculate_sector_exposure()[0]
-
     my_divisions = list(set(exposures_ranked["division"]))
 
     division_month_exposure_dict = (
@@ -112,28 +99,87 @@ def make_div_share_variable(exposure_level=7, div_level=3):
         .to_dict()
     )
 
-    logging.info("Making sector space")
-    my_divisions = list(set(exposures_ranked["division"]))
-    pr = load_predicted()
-    pr_selected = pr[my_divisions]
-    t = extract_sectors(pr_selected, 0.5)
-
-    div_space = extract_network(t)
-    p, g, lnk = make_sector_space_base(sector_space=div_space, extra_edges=70)
+    logging.info("Reading predicted sectors")
+    pr_selected = load_predicted()[my_divisions]
 
     logging.info("Calculating local exposure shares")
     bres = read_official()
-
     exposure_levels = exposures_ranked.merge(
         bres, left_on="division", right_on="division"
     )
     exposure_levels["division_name"] = exposure_levels["division"].map(
         _DIVISION_NAME_LOOKUP
     )
-    # exposure_lad_detailed = make_exposure_shares_detailed(exposure_levels, "geo_nm")
+    exposure_lad_codes = make_exposure_shares(exposure_levels, "geo_cd")
 
-    logging.info("Calculating diversification share rankings")
-    monthly_diversification_rankings = pd.concat(
+    return {
+        "exposures_ranked": exposures_ranked,
+        "division_month_exposure_dict": division_month_exposure_dict,
+        "predicted": pr_selected,
+        "exposure_levels": exposure_levels,
+        "exposure_lad_codes": exposure_lad_codes,
+    }
+
+
+def make_high_exposure_share(exposure_lad_codes, exposure_thres=7):
+    """Extracts the share of employment in highly exposed sectors by LAD
+    Args:
+        exposure_lad_codes (df): local exposure shares
+        exposure_thres (int): exposure ranking
+    """
+    logging.info(f"Calculating high exposure shares level {exposure_thres}")
+    return (
+        make_high_exposure(exposure_lad_codes, geo="geo_cd", level=exposure_thres)
+        .assign(variable="exposure_share")
+        .rename(columns={"share": "value"})
+    )
+
+
+def make_exposure_share_variable(exposure_thres=7, inputs=None):
+    """Extracts exposure shares by LAD
+    Args:
+        exposure_thres (int): exposure ranking
+        inputs (dict): outputs of make_threshold_inputs. If None we calculate
+            the sector exposures and local exposure shares
+    """
+    if inputs is None:
+        logging.info("Calculating sector exposure")
+        exposures_ranked = calculate_sector_exposure()[0]
+
+        logging.info("Calculating local exposure shares")
+        exposure_lad_codes = make_local_exposure_table(exposures_ranked)
+    else:
+        exposure_lad_codes = inputs["exposure_lad_codes"]
+
+    return make_high_exposure_share(exposure_lad_codes, exposure_thres)
+
+
+def make_div_space(pr_selected, pred_thres=0.5, extra_edges=70):
+    """Makes the sector space based on predicted divisions for Glass companies
+    Args:
+        pr_selected (df): predicted division probabilities
+        pred_thres (float): probability threshold to assign a company to a division
+        extra_edges (int): extra edges to add to the maximum spanning tree
+    """
+    logging.info(f"Making sector space with threshold {pred_thres}")
+    t = extract_sectors(pr_selected, pred_thres)
+    div_space = extract_network(t)
+    return make_sector_space_graph(sector_space=div_space, extra_edges=extra_edges)
+
+
+def make_monthly_diversification_rankings(
+    g, division_month_exposure_dict, exposure_level=7, path_lengths=None
+):
+    """Ranks highly exposed sectors by their distance to less exposed
+    sectors in every month
+    Args:
+        g (network): sector space
+        division_month_exposure_dict (dict): lookup between division, month
+            and exposure
+        exposure_level (int): min threshold for high exposure
+        path_lengths (dict): precomputed shortest path lengths in g
+    """
+    return pd.concat(
         [
             (
                 make_diversification_options(
@@ -142,6 +188,7 @@ def make_div_share_variable(exposure_level=7, div_level=3):
                     m,
                     range(exposure_level, 10),
                     [0, 1, 2, 3],
+                    path_lengths=path_lengths,
                 )
                 .sort_values("mean", ascending=False)
                 .assign(
@@ -158,8 +205,14 @@ def make_div_share_variable(exposure_level=7, div_level=3):
         ]
     )
 
-    # Merge with diversification information
-    logging.info(f"Calculating diversification shares level {str(div_level)}")
+
+def make_div_ranking_shares(exposure_levels, monthly_diversification_rankings):
+    """Calculates LAD employment shares in each diversification ranking
+    Args:
+        exposure_levels (df): employment by LAD, division and exposure ranking
+        monthly_diversification_rankings (df): diversification rankings
+            by division and month
+    """
     diversification_lad_detailed = exposure_levels.assign(
         month_year=lambda x: x["month_year"].apply(month_string_from_datetime)
     ).merge(
@@ -172,12 +225,20 @@ def make_div_share_variable(exposure_level=7, div_level=3):
         "divers_ranking"
     ].fillna("Less exposed")
 
-    diversification_shares = (
-        make_exposure_shares(
-            diversification_lad_detailed, geography="geo_cd", variable="divers_ranking"
-        )
-        .query("divers_ranking!='Less exposed'")
-        .query(f"divers_ranking >= {div_level}")
+    return make_exposure_shares(
+        diversification_lad_detailed, geography="geo_cd", variable="divers_ranking"
+    ).query("divers_ranking!='Less exposed'")
+
+
+def make_low_div_share(div_ranking_shares, div_level=3):
+    """Extracts the share of employment in low diversification sectors by LAD
+    Args:
+        div_ranking_shares (df): LAD employment shares by diversification ranking
+        div_level (int): min threshold for low diversification
+    """
+    logging.info(f"Calculating diversification shares level {str(div_level)}")
+    return (
+        div_ranking_shares.query(f"divers_ranking >= {div_level}")
         .groupby(["geo_cd", "month_year"])["share"]
         .sum()
         .reset_index(name="share")
@@ -189,7 +250,135 @@ def make_div_share_variable(exposure_level=7, div_level=3):
         .reset_index(drop=True)
     )
 
-    return diversification_shares
+
+def make_div_share_variable(exposure_level=7, div_level=3, pred_thres=0.5, inputs=None):
+    """Calculates the share of employment in a low diversification sector
+    Args:
+        exposure_level (int): min threshold for high exposure
+        div_leve (int): min threshold for low diversification
+        pred_thres (float): probability threshold for the sector space
+        inputs (dict): outputs of make_threshold_inputs. If None we calculate them
+    """
+    if inputs is None:
+        inputs = make_threshold_inputs()
+
+    logging.info("Making sector space")
+    g = make_div_space(inputs["predicted"], pred_thres)
+
+    logging.info("Calculating diversification share rankings")
+    monthly_diversification_rankings = make_monthly_diversification_rankings(
+        g, inputs["division_month_exposure_dict"], exposure_level
+    )
+
+    # Merge with diversification information
+    div_ranking_shares = make_div_ranking_shares(
+        inputs["exposure_levels"], monthly_diversification_rankings
+    )
+
+    return make_low_div_share(div_ranking_shares, div_level)
+
+
+# Threshold sweeps: the inputs are shared by all worker processes
+_SWEEP_INPUTS = {}
+
+
+def _init_sweep_worker(inputs):
+    """Stores the threshold-independent inputs in a sweep worker"""
+    _SWEEP_INPUTS.update(inputs)
+
+
+def _sweep_sector_space(pred_thres):
+    """Makes the sector space and its path lengths for a prediction threshold"""
+    g = make_div_space(_SWEEP_INPUTS["predicted"], pred_thres)
+    return g, dict(nx.all_pairs_shortest_path_length(g))
+
+
+def _sweep_div_shares(pred_thres, exposure_level, div_levels, g, path_lengths):
+    """Calculates low diversification shares for all div levels given
+    a prediction threshold and an exposure level
+    """
+    rankings = make_monthly_diversification_rankings(
+        g,
+        _SWEEP_INPUTS["division_month_exposure_dict"],
+        exposure_level,
+        path_lengths=path_lengths,
+    )
+    div_ranking_shares = make_div_ranking_shares(
+        _SWEEP_INPUTS["exposure_levels"], rankings
+    )
+    return [
+        make_low_div_share(div_ranking_shares, div_level).assign(
+            pred_thres=pred_thres, exposure_level=exposure_level, div_level=div_level
+        )
+        for div_level in div_levels
+    ]
+
+
+def make_threshold_sweep(
+    exposure_levels=range(5, 10),
+    div_levels=range(1, 4),
+    pred_thresholds=(0.3, 0.4, 0.5, 0.6, 0.7),
+    inputs=None,
+    n_jobs=None,
+):
+    """Calculates the exposure and low diversification share variables for
+    every combination of thresholds
+    Args:
+        exposure_levels (list): exposure thresholds
+        div_levels (list): diversification thresholds
+        pred_thresholds (list): probability thresholds for the sector space
+        inputs (dict): outputs of make_threshold_inputs. If None we calculate them
+        n_jobs (int): number of worker processes. If None we use all cores
+    Returns:
+        long df with month_year, geo_cd, variable, value and the threshold
+        values (pred_thres, exposure_level, div_level) for each combination
+    """
+    if inputs is None:
+        inputs = make_threshold_inputs()
+
+    exposure_levels, div_levels = list(exposure_levels), list(div_levels)
+
+    # Exposure shares only depend on the exposure level
+    exposure_shares = {
+        level: make_high_exposure_share(inputs["exposure_lad_codes"], level)
+        for level in exposure_levels
+    }
+
+    with ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_init_sweep_worker, initargs=(inputs,)
+    ) as executor:
+        logging.info("Making sector spaces")
+        spaces = dict(
+            zip(pred_thresholds, executor.map(_sweep_sector_space, pred_thresholds))
+        )
+
+        logging.info("Calculating diversification shares")
+        futures = [
+            executor.submit(_sweep_div_shares, pred, level, div_levels, *spaces[pred])
+            for pred, level in product(pred_thresholds, exposure_levels)
+        ]
+        div_shares = [x for f in futures for x in f.result()]
+
+    exp_shares = [
+        exposure_shares[level].assign(
+            pred_thres=pred, exposure_level=level, div_level=div_level
+        )
+        for pred, level, div_level in product(
+            pred_thresholds, exposure_levels, div_levels
+        )
+    ]
+
+    return pd.concat(exp_shares + div_shares).reset_index(drop=True)[
+        [
+            "pred_thres",
+            "exposure_level",
+            "div_level",
+            "month_year",
+            "geo_cd",
+            "variable",
+            "value",
+        ]
+    ]
 
 
 def make_claimant_count_variable():
@@ -256,18 +445,22 @@ def make_lagged_web(var, name):
     values before its current month)
     """
 
-    results = []
-
     var_ = var.query("month_year>'2020-03-01'")
 
-    for m in set(var_["month_year"]):
-        pre = var_.query(f"month_year<'{m}'")
-        stat = pre.groupby(["geo_cd", "variable"])["value"].mean()
-        stat.name = m
-        # stat.assign(month=m)
-        results.append(stat)
+    # Sums and counts of values by geography, variable and month
+    grouped = var_.groupby(["geo_cd", "variable", "month_year"])["value"]
+    sums, counts = [
+        stat.unstack("month_year", fill_value=0).sort_index(axis=1)
+        for stat in [grouped.sum(), grouped.count()]
+    ]
+
+    # Expanding mean of all the months before the current one
+    prev_sums, prev_counts = [
+        stat.cumsum(axis=1).shift(1, axis=1) for stat in [sums, counts]
+    ]
+    results_df = prev_sums / prev_counts.where(prev_counts > 0)
+    results_df.columns.name = None
 
-    results_df = pd.concat(results, axis=1)
     lagged = (
         results_df.loc[
             :, [x > datetime.datetime(2020, 4, 1) for x in results_df.columns]
@@ -293,19 +486,20 @@ def make_secondary_reg(keep, secondary):
     return sec_wide[keep]
 
 
-def make_predictors(
-    exp,
-    div,
-    secondary,
-    keep=["% tertiary", "Gross annual pay", "Emp rate", "ECI", "% no qual"],
-):
-    """Creates a table of predictors for the regression analysis
-    exp (df): measures of exposure
-    div (df): measures of diversification
-    secondary (df): secondary variables
-    """
-    # Present period exposure / diversification variables
+# Design matrices we have already built, keyed by their inputs
+_DESIGN_MATRIX_CACHE = {}
+
 
+def _frame_fingerprint(df):
+    """Hashes the contents of a df so we can use it as a cache key"""
+    h = hashlib.md5(str(tuple(df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def _build_predictors(exp, div, secondary, keep):
+    """Builds the table of predictors (see make_predictors)"""
+    # Present period exposure / diversification variables
     present = pd.concat(
         [
             var.rename(columns={"value": f"{name}_present"})
@@ -334,6 +528,31 @@ def make_predictors(
     )
 
 
+def make_predictors(
+    exp,
+    div,
+    secondary,
+    keep=["% tertiary", "Gross annual pay", "Emp rate", "ECI", "% no qual"],
+):
+    """Creates a table of predictors for the regression analysis. Tables are
+    cached by their inputs so repeated calls (eg for each model) reuse them
+    exp (df): measures of exposure
+    div (df): measures of diversification
+    secondary (df): secondary variables
+    """
+    key = (
+        _frame_fingerprint(exp),
+        _frame_fingerprint(div),
+        _frame_fingerprint(secondary),
+        tuple(keep),
+    )
+    if key not in _DESIGN_MATRIX_CACHE:
+        logging.info("Building design matrix")
+        _DESIGN_MATRIX_CACHE[key] = _build_predictors(exp, div, secondary, keep)
+
+    return _DESIGN_MATRIX_CACHE[key].copy()
+
+
 def make_regression_table(
     cl,
     exp,
@@ -356,33 +575,9 @@ def make_regression_table(
         .pivot_table(index=["geo_cd", "month_year"], columns="variable", values="value")
     )
 
-    # Present period exposure / diversification variables
-    present = pd.concat(
-        [
-            var.rename(columns={"value": f"{name}_present"})
-            .query("month_year>'2020-03-01'")
-            .set_index(["month_year", "geo_cd"])
-            .drop(axis=1, labels=["variable"])
-            for var, name in zip([exp, div], ["exposure_share", "low_div_share"])
-        ],
-        axis=1,
-    ).reset_index(drop=False)
-
-    lagged = pd.concat(
-        [
-            make_lagged_web(v, name)
-            for v, name in zip([exp, div], ["exposure_share", "low_div_share"])
-        ],
-        axis=1,
-    ).reset_index(drop=False)
-
-    sec_vars = make_secondary_reg(keep, secondary)
+    predictors = make_predictors(exp, div, secondary, keep)
 
-    data = (
-        X.merge(present, on=["geo_cd", "month_year"])
-        .merge(lagged, on=["geo_cd", "month_year"])
-        .merge(sec_vars, on="geo_cd")
-    )
+    data = X.merge(predictors, on=["geo_cd", "month_year"])
 
     return data
 
@@ -544,13 +739,99 @@ def plot_correlation_evolution(reg_table, nuts_focus="Scotland"):
     return corr_evol
 
 
-def fit_regression(table, dep, indep_focus, fe=True):
+class FixedEffectsResults:
+    """Results of a regression with (optional) place fixed effects
+    estimated with the within transformation
+    Attributes:
+        results (statsmodels results): results for the (within) regression
+        fixed_effects (series): estimated fixed effects by geography (None
+            if the regression didn't include fixed effects)
+        geo_var (str): geography variable for the fixed effects
+    """
+
+    def __init__(self, results, fixed_effects=None, geo_var="geo_cd"):
+        self.results = results
+        self.fixed_effects = fixed_effects
+        self.geo_var = geo_var
+
+    @property
+    def params(self):
+        return self.results.params
+
+    @property
+    def bse(self):
+        return self.results.bse
+
+    def conf_int(self, alpha=0.05):
+        return self.results.conf_int(alpha=alpha)
+
+    def summary(self):
+        return self.results.summary()
+
+    def predict(self, exog):
+        """Predicts values for a table including the regressors and
+        (if we have fixed effects) the geography variable
+        """
+        X = exog.assign(const=1)[self.params.index]
+        predicted = X @ self.params
+
+        if self.fixed_effects is not None:
+            predicted = predicted + exog[self.geo_var].map(self.fixed_effects)
+        return predicted
+
+
+def make_within_cov(X, resid, groups, cov_type="HC2"):
+    """Calculates the covariance of a within (fixed effects) regression,
+    accounting for the degrees of freedom and leverage of the fixed effects
+    Args:
+        X (array): within-transformed regressors
+        resid (array): residuals
+        groups (array): geography for each observation
+        cov_type (str): nonrobust, HC0, HC1, HC2 or cluster (by geography)
+    """
+    n, k = X.shape
+    group_sizes = pd.Series(groups).value_counts()
+    n_groups = len(group_sizes)
+    dof = n - k - n_groups
+
+    bread = np.linalg.pinv(X.T @ X)
+
+    if cov_type == "nonrobust":
+        return bread * (resid @ resid) / dof
+
+    if cov_type == "cluster":
+        scores = pd.DataFrame(X * resid[:, None]).groupby(groups).sum().values
+        meat = scores.T @ scores
+        # Fixed effects are nested in the clusters so we don't count them in k
+        meat *= n_groups / (n_groups - 1) * (n - 1) / (n - k)
+        return bread @ meat @ bread
+
+    weights = resid ** 2
+    if cov_type == "HC1":
+        weights = weights * n / dof
+    elif cov_type == "HC2":
+        # Leverage in the dummy regression = within leverage + 1 / group size
+        leverage = (
+            np.einsum("ij,jk,ik->i", X, bread, X)
+            + 1 / pd.Series(groups).map(group_sizes).values
+        )
+        weights = weights / (1 - leverage)
+    elif cov_type != "HC0":
+        raise ValueError(f"Covariance type {cov_type} not supported")
+
+    meat = (X * weights[:, None]).T @ X
+    return bread @ meat @ bread
+
+
+def fit_regression(table, dep, indep_focus, fe=True, cov_type="HC2"):
     """Fits regression
     Args:
         table (df): table with all the variables we will use in the regression
         dep (str): dependent variable
         indep_focus: independent variables we focus on
-        fe (bool): if we include place fixed effects
+        fe (bool): if we include place fixed effects. We estimate them by
+            demeaning variables within places rather than with dummies
+        cov_type (str): nonrobust, HC0, HC1, HC2 or cluster (by geography)
     """
 
     table_ = table.dropna(axis=0).sort_values("geo_cd")
@@ -572,14 +853,51 @@ def fit_regression(table, dep, indep_focus, fe=True):
         ]
     )
 
-    fe = pd.get_dummies(table_["geo_cd"])
+    exog = pd.concat([indep, other_vars], axis=1).astype(float)
+
+    if not fe:
+        lm = sm.OLS(endog=Y, exog=sm.add_constant(exog))
+        if cov_type == "cluster":
+            return FixedEffectsResults(
+                lm.fit(cov_type=cov_type, cov_kwds={"groups": table_["geo_cd"]})
+            )
+        return FixedEffectsResults(lm.fit(cov_type=cov_type))
+
+    # Within transformation
+    geo_means = pd.concat([Y, exog], axis=1).groupby(table_["geo_cd"]).mean()
+    Y_within = Y - table_["geo_cd"].map(geo_means[dep])
+    exog_within = exog - geo_means[exog.columns].loc[table_["geo_cd"]].values
+
+    # Variables that don't change within places are absorbed by the fixed effects
+    absorbed = exog_within.columns[np.isclose(exog_within.abs().max(), 0)]
+    if len(absorbed) > 0:
+        logging.info(f"Absorbed by the fixed effects: {', '.join(absorbed)}")
+        exog_within = exog_within.drop(columns=absorbed)
+
+    lm = sm.OLS(endog=Y_within, exog=exog_within)
+    params = lm.fit().params
+
+    resid = (Y_within - exog_within @ params).values
+    cov = make_within_cov(
+        exog_within.values, resid, table_["geo_cd"].values, cov_type=cov_type
+    )
+    lm.df_resid = len(Y) - len(params) - len(geo_means)
+
+    results = RegressionResults(
+        lm,
+        params.values,
+        normalized_cov_params=cov,
+        use_t=cov_type == "nonrobust",
+    )
+    # The covariance already includes the error variance
+    results.scale = 1.0
+    results.cov_type = cov_type
+    results = RegressionResultsWrapper(results)
 
-    exog = pd.concat([indep, other_vars, fe], axis=1)
+    # Recover fixed effects
+    fixed_effects = geo_means[dep] - geo_means[params.index] @ params
 
-    # exog=sm.add_constant(exog)
-    lm = sm.OLS(endog=Y, exog=exog)
-    return lm.fit(cov_type="HC2")
-    # return exog
+    return FixedEffectsResults(results, fixed_effects)
 
 
 def extract_model_results(model, name):
@@ -595,6 +913,94 @@ def extract_model_results(model, name):
     return res
 
 
+# Model grids: the regression table is shared by all worker processes
+_GRID_TABLE = {}
+
+
+def _init_grid_worker(table):
+    """Stores the regression table in a model grid worker"""
+    _GRID_TABLE["table"] = table
+
+
+def _fit_spec(spec):
+    """Fits the regression for a model specification"""
+    table = _GRID_TABLE["table"]
+
+    if spec.get("months") is not None:
+        table = table.loc[table["month_year"].isin(pd.to_datetime(spec["months"]))]
+
+    return fit_regression(
+        table,
+        spec["dep"],
+        spec["indep"],
+        fe=spec.get("fe", True),
+        cov_type=spec.get("cov_type", "HC2"),
+    )
+
+
+def make_model_specs(
+    deps=("cl_count", "cl_count_norm"),
+    indeps=("exp", "div"),
+    fe=True,
+    cov_type="HC2",
+    months=None,
+):
+    """Creates model specifications for all combinations of dependent and
+    independent variables
+    Args:
+        deps (list): dependent variables
+        indeps (list): independent variables we focus on
+        fe (bool): if we include place fixed effects
+        cov_type (str): covariance type
+        months (list): months to fit the models on. If None we use all months
+    """
+    return [
+        {
+            "name": f"{dep}_{indep}",
+            "dep": dep,
+            "indep": indep,
+            "fe": fe,
+            "cov_type": cov_type,
+            "months": months,
+        }
+        for dep, indep in product(deps, indeps)
+    ]
+
+
+def fit_model_grid(table, specs, n_jobs=None):
+    """Fits a regression for each model specification in parallel
+    Args:
+        table (df): table with all the variables we will use in the regressions
+        specs (list): model specifications. Dicts with dep, indep and optionally
+            name, fe, cov_type and months (see make_model_specs)
+        n_jobs (int): number of worker processes. If None we use all cores
+    Returns:
+        dict of fitted models keyed by specification name and a tidy df
+        with their coefficients and confidence intervals
+    """
+    names = [spec.get("name", f"{spec['dep']}_{spec['indep']}") for spec in specs]
+
+    logging.info(f"Fitting {len(specs)} models")
+    with ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_init_grid_worker, initargs=(table,)
+    ) as executor:
+        mods = dict(zip(names, executor.map(_fit_spec, specs)))
+
+    model_results = pd.concat(
+        [
+            extract_model_results(mods[name], name=name).assign(
+                model=name,
+                focus=spec["indep"],
+                fe=spec.get("fe", True),
+                cov_type=spec.get("cov_type", "HC2"),
+            )
+            for name, spec in zip(names, specs)
+        ]
+    ).reset_index(drop=False)
+
+    return mods, model_results
+
+
 # def plot_variable_correlations(exp, div, cl, secondary):
 #     """Plots correlations between variables in our model
 #     Args:
@@ -820,6 +1226,9 @@ def make_predicted_values(mods, exp, div, secondary, month="2021-01-01"):
 
     predictive_results_container = []
 
+    # All models share the same predictors
+    predictors = make_predictors(exp, div, secondary)
+
     # For each model
     for k, model in mods.items():
 
@@ -835,20 +1244,15 @@ def make_predicted_values(mods, exp, div, secondary, month="2021-01-01"):
 
         # Make predictors
         p = (
-            make_predictors(exp, div, secondary)
-            .query(f"month_year=='{month}'")
+            predictors.query(f"month_year=='{month}'")
             .dropna(axis=0)
-        ).reset_index(drop=True)
-
-        # Add fixed effects
-        p_fe = pd.concat([p, pd.get_dummies(p["geo_cd"])], axis=1).drop(
-            columns=["geo_cd", "month_year"]
+            .reset_index(drop=True)
         )
 
-        # Drop irrelevant predictors
-        p_fe = p_fe.loc[:, [drop not in x for x in p_fe.columns]]
+        # Drop irrelevant predictors (the model adds place fixed effects)
+        p = p.loc[:, [drop not in x for x in p.columns]]
 
-        predicted = pd.DataFrame(model.predict(p_fe), columns=["value"])
+        predicted = model.predict(p).to_frame(name="value")
 
         # Add metadata
         predicted["geo_cd"] = p["geo_cd"]
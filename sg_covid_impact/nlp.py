@@ -1,20 +1,38 @@
 """NLP utils & functions for Glass description processing and salient term extraction."""
-from itertools import combinations, chain
-from typing import Any, Dict, Iterable, List, Optional
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import hashlib
+import json
+import logging
+import os
 import re
 import string
 
+import gensim
 import nltk
+import numpy as np
 import pandas as pd
 import toolz.curried as t
 from gensim import models
 from Levenshtein import distance
 from nltk.corpus import stopwords
 from nltk.stem import PorterStemmer
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
 
 
+from sg_covid_impact import project_dir
 from sg_covid_impact.utils.list_utils import flatten_freq
 
+logger = logging.getLogger(__name__)
+
+# Trained phrase models, keyed by their corpus, parameters and gensim version
+# (used if passed as `cache_dir`)
+PHRASE_MODEL_DIR = Path(f"{project_dir}/data/interim/phrase_models")
+
 nltk.download("stopwords", quiet=True)
 nltk.download("punkt", quiet=True)
 
@@ -49,6 +67,14 @@ _REGEX_STR = [
 # Create the tokenizer which will be case insensitive and will ignore space.
 tokens_re = re.compile(r"(" + "|".join(_REGEX_STR) + ")", re.VERBOSE | re.IGNORECASE)
 
+# Tokenizer for `clean_and_tokenize`: the same alternatives without the
+# duplicate single character branch (it can never match)
+_clean_tokens_re = re.compile(
+    r"(?:" + "|".join(_REGEX_STR[:-1]) + ")", re.VERBOSE | re.IGNORECASE
+)
+# Tokens with no digits and at least one ascii lowercase character
+_keep_token_re = re.compile(r"[^0-9]*[a-z][^0-9]*")
+
 
 def tokenize_document(text, remove_stops=False):
     """Preprocess a whole raw document.
@@ -73,22 +99,25 @@ def clean_and_tokenize(text, remove_stops):
     Return:
        tokens (list, str): Preprocessed tokens.
     """
-    tokens = tokens_re.findall(text)
-    _tokens = [t.lower() for t in tokens]
-    filtered_tokens = [
-        token.replace("-", "_")
-        for token in _tokens
-        # Conditions to be kept:
-        # - Longer than 2 characters if `remove_stops`
-        # - Not be a stop words if `remove_stops`
-        # - No digits in token
-        # - At least one ascii lowercase character
-        if not (remove_stops and len(token) <= 2)
-        and (not remove_stops or token not in _STOP_WORDS)
-        and not any(x in token for x in string.digits)
-        and any(x in token for x in string.ascii_lowercase)
-    ]
-    return filtered_tokens
+    # Lower-casing ascii text doesn't change what the tokenizer matches
+    if text.isascii():
+        tokens = _clean_tokens_re.findall(text.lower())
+    else:
+        tokens = [token.lower() for token in _clean_tokens_re.findall(text)]
+
+    # Conditions to be kept:
+    # - Longer than 2 characters if `remove_stops`
+    # - Not be a stop words if `remove_stops`
+    # - No digits in token
+    # - At least one ascii lowercase character
+    keep = _keep_token_re.fullmatch
+    if remove_stops:
+        return [
+            token.replace("-", "_")
+            for token in tokens
+            if len(token) > 2 and token not in _STOP_WORDS and keep(token)
+        ]
+    return [token.replace("-", "_") for token in tokens if keep(token)]
 
 
 def tokenize(text: str, tokens_re: re.Pattern) -> Iterable[str]:
@@ -101,28 +130,204 @@ def tokenize(text: str, tokens_re: re.Pattern) -> Iterable[str]:
     )
 
 
-def make_ngram(tokenised_corpus, n_gram=2, threshold=10):
+# Tokenizer used by the workers of `tokenize_parallel`
+_WORKER_TOKENIZER = {}
+
+
+def _init_tokenize_worker(tokenizer: Callable[[str], List[str]]) -> None:
+    """Stores the tokenizer (and its regexes, stop words...) in a worker."""
+    _WORKER_TOKENIZER["tokenizer"] = tokenizer
+
+
+def _tokenize_chunk(texts: List[str]) -> List[List[str]]:
+    """Tokenizes a chunk of documents in a worker."""
+    tokenizer = _WORKER_TOKENIZER["tokenizer"]
+    return [tokenizer(text) for text in texts]
+
+
+def tokenize_parallel(
+    texts: Iterable[str],
+    tokenizer: Callable[[str], List[str]],
+    chunksize: int = 1_000,
+    n_jobs: Optional[int] = None,
+) -> Iterable[List[str]]:
+    """Tokenize documents in chunks across a pool of worker processes.
+
+    Workers receive `tokenizer` once when they start. Chunks of `texts` are
+    streamed to them (with at most two chunks in flight per worker) and the
+    results are yielded in the same order as `texts`.
+
+    Args:
+        texts: Raw documents.
+        tokenizer: Picklable function (e.g. a `functools.partial` of
+            `clean_and_tokenize` or `tokenize_document`) returning the
+            tokens of a document.
+        chunksize: Number of documents sent to a worker at a time.
+        n_jobs: Number of worker processes. If None, use all cores.
+
+    Yields:
+        Tokenized documents
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    with ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_init_tokenize_worker, initargs=(tokenizer,)
+    ) as executor:
+        pending = deque()
+        for chunk in t.partition_all(chunksize, texts):
+            pending.append(executor.submit(_tokenize_chunk, chunk))
+            if len(pending) >= 2 * n_jobs:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class TokenFileCorpus:
+    """Restartable iterable over the tokenised documents in a token file.
+
+    Token files have one document per line, stored as a JSON list of tokens.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def __iter__(self) -> Iterator[List[str]]:
+        with self.path.open("r") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def write_token_file(documents: Iterable[List[str]], path) -> TokenFileCorpus:
+    """Write tokenised documents to a token file, one document at a time.
+
+    Args:
+        documents: Tokenised documents.
+        path: Output file path.
+
+    Returns:
+        Corpus reading the documents back from `path`.
+    """
+    with Path(path).open("w") as f:
+        for document in documents:
+            f.write(json.dumps(list(document)) + "\n")
+    return TokenFileCorpus(path)
+
+
+def corpus_fingerprint(
+    documents: Iterable[List[str]], phrase_kws: Optional[Dict[str, Any]] = None
+) -> str:
+    """Hash a tokenised corpus (and phrase model parameters), one document
+    at a time.
+    """
+    h = hashlib.sha1(repr(sorted((phrase_kws or {}).items())).encode())
+    for document in documents:
+        h.update(json.dumps(list(document)).encode())
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def train_phraser(
+    documents: Iterable[List[str]],
+    phrase_kws: Dict[str, Any],
+    cache_path: Optional[Path] = None,
+) -> models.phrases.Phraser:
+    """Train a frozen phrase model, loading it from `cache_path` if it exists.
+
+    Args:
+        documents: Tokenized documents.
+        phrase_kws: Passed to `gensim.models.Phrases`.
+        cache_path: Where the trained model is (or will be) saved. If None,
+            the model is not cached.
+
+    Return:
+        Frozen phrase model
+    """
+    if cache_path is not None and cache_path.exists():
+        logger.info(f"Loading phrase model from {cache_path}")
+        return models.phrases.Phraser.load(str(cache_path))
+
+    phrases = models.Phrases(documents, **phrase_kws)
+    phraser = models.phrases.Phraser(phrases)
+    del phrases
+
+    if cache_path is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        phraser.save(str(cache_path))
+    return phraser
+
+
+def stream_ngrams(
+    documents: Iterable[List[str]],
+    n: int = 2,
+    phrase_kws: Optional[Dict[str, Any]] = None,
+    output_path=None,
+    cache_dir: Optional[Path] = None,
+) -> Iterable[List[str]]:
+    """Create ngrams using Gensim's phrases without holding the corpus in memory.
+
+    Each step trains `gensim.models.Phrases` on the output of the previous
+    step and freezes it. Frozen phrasers are applied lazily, so only one
+    document at a time is held in memory (as well as the phrase models).
+
+    Args:
+        documents: Tokenized documents. Must be restartable (e.g. a list or
+            `TokenFileCorpus`) as it is iterated over once per step.
+        n: The `n` in n-gram.
+        phrase_kws: Passed to `gensim.models.Phrases`.
+        output_path: If given, n-grammed documents are written to this token
+            file.
+        cache_dir: If given, frozen phrase models are saved in (and loaded
+            from) this directory, keyed by a hash of `documents`,
+            `phrase_kws` and the gensim version.
+
+    Return:
+        Lazy iterable of n-grammed documents (a `TokenFileCorpus` if
+        `output_path` is given)
+    """
+    if iter(documents) is documents:
+        raise TypeError("Pass a restartable iterable (not an iterator) of documents")
+
+    if phrase_kws is None:
+        phrase_kws = {}
+
+    if cache_dir is not None and n > 1:
+        # Pickled phrase models aren't portable across gensim versions
+        key = corpus_fingerprint(
+            documents, {**phrase_kws, "gensim_version": gensim.__version__}
+        )
+
+    for step in range(1, n):
+        cache_path = None if cache_dir is None else Path(cache_dir) / f"{key}_{step}"
+        phraser = train_phraser(documents, phrase_kws, cache_path)
+        documents = phraser[documents]
+
+    if output_path is not None:
+        return write_token_file(documents, output_path)
+    return documents
+
+
+def make_ngram(tokenised_corpus, n_gram=2, threshold=10, cache_dir=None):
     """Extract bigrams from tokenised corpus
     Args:
         tokenised_corpus (list): List of tokenised corpus
         n_gram (int): maximum length of n-grams. Defaults to 2 (bigrams)
         threshold (int): min number of n-gram occurrences before inclusion
+        cache_dir (path): directory with cached phrase models (eg
+            `PHRASE_MODEL_DIR`). If None we always train them
     Returns:
         ngrammed_corpus (list)
     """
-    tokenised = tokenised_corpus.copy()
-    t = 1
-    # Loops while the ngram length less / equal than our target
-    while t < n_gram:
-        phrases = models.Phrases(tokenised, threshold=threshold)
-        bigram = models.phrases.Phraser(phrases)
-        tokenised = bigram[tokenised]
-        t += 1
-    return list(tokenised)
+    return list(
+        stream_ngrams(
+            tokenised_corpus, n_gram, {"threshold": threshold}, cache_dir=cache_dir
+        )
+    )
 
 
 def make_ngrams_v2(
-    documents: List[List[str]], n: int = 2, phrase_kws: Optional[Dict[str, Any]] = None
+    documents: List[List[str]],
+    n: int = 2,
+    phrase_kws: Optional[Dict[str, Any]] = None,
+    cache_dir: Optional[Path] = None,
 ) -> List[List[str]]:
     """Create ngrams using Gensim's phrases.
 
@@ -130,6 +335,8 @@ def make_ngrams_v2(
         documents: Tokenized documents.
         n: The `n` in n-gram.
         phrase_kws: Passed to `gensim.models.Phrases`.
+        cache_dir: Directory with cached phrase models (e.g.
+            `PHRASE_MODEL_DIR`). If None, always train them.
 
     Return:
         N-grams
@@ -152,15 +359,7 @@ def make_ngrams_v2(
         def_phrase_kws.update(phrase_kws)
         phrase_kws = def_phrase_kws
 
-    t = 1
-    while t < n:
-        phrases = models.Phrases(documents, **phrase_kws)
-        bigram = models.phrases.Phraser(phrases)
-        del phrases
-        tokenised = bigram[documents]
-        t += 1
-
-    return list(tokenised)
+    return list(stream_ngrams(documents, n, phrase_kws, cache_dir=cache_dir))
 
 
 def salient_words_per_category(token_df, corpus_freqs, thres, top_words=100):
@@ -213,14 +412,112 @@ def get_category_salience(
         list(rel_corp), corpus_freqs, thres, top_words
     )
     # Rename df
-    salient_renamed = salient_rel.rename(
+    return rename_salience_columns(salient_rel, sel_term)
+
+
+def rename_salience_columns(salient_terms, sel_term):
+    """Renames the columns of a salient terms df after their category"""
+    return salient_terms.rename(
         columns={
             "sub_corpus": f"{str(sel_term)}_freq",
             "corpus": "all_freq",
             "salience": f"{str(sel_term)}_salience",
         }
     )
-    return salient_renamed
+
+
+def make_term_matrix(documents):
+    """Create a sparse document x term count matrix
+    Args:
+        documents (list or series): List where every element is a tokenised doc
+    Returns:
+        Sparse count matrix and its terms (in column order)
+    """
+    vectoriser = CountVectorizer(analyzer=lambda tokens: tokens)
+    term_matrix = vectoriser.fit_transform(documents)
+    vocabulary = vectoriser.vocabulary_
+    return term_matrix, sorted(vocabulary, key=vocabulary.get)
+
+
+def salient_words_all_categories(documents, categories, thres=5, top_words=100):
+    """Returns salient terms for every category in a corpus at once
+    Args:
+        documents (list or series): List where every element is a tokenised doc
+        categories (list or series): category of each document
+        thres (float): min number of word occurrences in a category
+        top_words (int): number of words to report per category
+    Returns:
+        dict where keys are categories and values are dfs with the frequency
+        of terms in the category, the corpus and their salience (as in
+        get_category_salience)
+    """
+    term_matrix, terms = make_term_matrix(documents)
+    terms = np.array(terms)
+    corpus_freqs = np.asarray(term_matrix.sum(axis=0)).ravel()
+
+    # Document -> category indicator
+    codes, cats = pd.factorize(pd.Series(categories), sort=True)
+    in_cat = codes >= 0
+    indicator = sparse.csr_matrix(
+        (np.ones(in_cat.sum()), (codes[in_cat], np.flatnonzero(in_cat))),
+        shape=(len(cats), term_matrix.shape[0]),
+    )
+
+    # Term counts by category
+    cat_freqs = (indicator @ term_matrix).tocsr()
+    cat_freqs.sort_indices()
+    rows = np.repeat(np.arange(len(cats)), np.diff(cat_freqs.indptr))
+    cols, freqs = cat_freqs.indices, cat_freqs.data
+    salience = freqs / corpus_freqs[cols]
+
+    # Keep frequent terms and rank them by salience within categories
+    # (terms are in alphabetical order so ties are broken alphabetically)
+    keep = np.flatnonzero(freqs > thres)
+    ranked = keep[np.lexsort((-salience[keep], rows[keep]))]
+    starts = np.searchsorted(rows[ranked], np.arange(len(cats)))
+    top = ranked[np.arange(len(ranked)) - starts[rows[ranked]] < top_words]
+
+    results = pd.DataFrame(
+        {
+            "sub_corpus": freqs[top],
+            "corpus": corpus_freqs[cols[top]],
+            "salience": salience[top],
+        },
+        index=terms[cols[top]],
+    )
+    cat_results = dict(list(results.groupby(rows[top])))
+
+    return {
+        cat: rename_salience_columns(cat_results.get(n, results.iloc[:0]), cat)
+        for n, cat in enumerate(cats)
+    }
+
+
+def find_levenshtein_pairs(terms, lev_length=10, lev_dist=3):
+    """Finds pairs of long terms within a Levenshtein distance. We only
+    compare terms whose lengths are within the distance threshold
+    Args:
+        terms (list): terms
+        lev_length: Minimum length of the first term in a pair
+        lev_dist: Levenshtein distance threshold
+
+    Returns:
+        Pairs of positions in `terms` (the first always before the second)
+    """
+    # Bucket term positions by length
+    length_buckets = {}
+    for pos, term in enumerate(terms):
+        length_buckets.setdefault(len(term), []).append(pos)
+
+    pairs = []
+    for pos, term in enumerate(terms):
+        if len(term) <= lev_length:
+            continue
+        for length in range(len(term) - lev_dist, len(term) + lev_dist + 1):
+            for other in length_buckets.get(length, []):
+                if other > pos and distance(term, terms[other]) <= lev_dist:
+                    pairs.append((pos, other))
+    return pairs
 
 
 def remove_dupes(results, div, lev_length=10, lev_dist=3):
@@ -232,30 +529,28 @@ def remove_dupes(results, div, lev_length=10, lev_dist=3):
     """
     ps = PorterStemmer()
 
-    # Pairs of terms in the index
-    pairs = list(combinations(results.index, 2))
-
-    # Find pairs with the same stem
-    close_pairs = []
-    for p in pairs:
+    terms = results.index.tolist()
+    freqs = results[f"{div}_freq"].values
 
-        if ps.stem(p[0]) == ps.stem(p[1]):
-            close_pairs.append(list(p))
-        # Stemming will not work with eg bigrams.
-        # For longer ngrams we consider levenshtein distances
-        else:
-            if len(p[0]) > lev_length:
-                if distance(p[0], p[1]) <= lev_dist:
-                    close_pairs.append(list(p))
-
-    # Drop the least salient term
-    drop = []
-
-    for c in close_pairs:
-        comp = results.loc[c]
-        drop_ = comp[f"{div}_freq"].idxmin()
-        drop.append(drop_)
-
-    rev_list = results.loc[~results.index.isin(drop)]
+    # Terms with the same stem: keep the most frequent (the last one if tied)
+    stems = pd.DataFrame(
+        {
+            "stem": [ps.stem(term) for term in terms],
+            "freq": freqs,
+            "pos": range(len(terms)),
+        }
+    )
+    keep = stems.sort_values(["freq", "pos"]).drop_duplicates("stem", keep="last")
+    drop = set(stems["pos"]) - set(keep["pos"])
+
+    # Stemming will not work with eg bigrams.
+    # For longer ngrams we consider levenshtein distances
+    # and drop the least frequent term in each close pair (the first if tied)
+    lev_pairs = np.array(find_levenshtein_pairs(terms, lev_length, lev_dist))
+    if len(lev_pairs) > 0:
+        first, second = lev_pairs[:, 0], lev_pairs[:, 1]
+        drop |= set(np.where(freqs[first] <= freqs[second], first, second))
+
+    rev_list = results.loc[~np.isin(np.arange(len(terms)), list(drop))]
 
     return rev_list
@@ -0,0 +1,17 @@
+# %%
+"""Queries relating to Glass - Companies House matches."""
+import pandas as pd
+
+
+def get_top_matches(
+    matches: pd.DataFrame, key: str = "company_number", score: str = "score"
+) -> pd.DataFrame:
+    """Keep the highest scoring match for each `key`.
+
+    Ties are resolved in favour of the first match in `matches`.
+    """
+    return (
+        matches.sort_values(score, ascending=False, kind="mergesort")
+        .drop_duplicates(key)
+        .sort_index()
+    )
@@ -1,14 +1,26 @@
 import random
 import logging
+import hashlib
+import json
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 import pandas as pd
 import numpy as np
 import altair as alt
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sklearn
+from scipy import sparse
 
 from sklearn.preprocessing import LabelBinarizer
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.model_selection import train_test_split
+from sklearn.utils.class_weight import compute_sample_weight
 
 import sg_covid_impact
 from sg_covid_impact.extract_salient_terms import make_glass_ch_merged
@@ -29,32 +41,129 @@ STOPWORDS = stopwords.words("english")
 
 project_dir = sg_covid_impact.project_dir
 
+MODEL_DIR = Path(f"{project_dir}/models/sector_prediction")
+PREDICTED_PATH = Path(
+    f"{project_dir}/data/processed/glass_companies_predicted_labels_v2.parquet"
+)
+FEATURE_DIR = Path(f"{project_dir}/data/interim/sector_features")
+TFIDF_PARAMS = {
+    "ngram_range": (1, 2),
+    "min_df": 20,
+    "max_df": 0.1,
+    "max_features": 10000,
+}
+
+
+def make_vectoriser():
+    """TF-IDF vectoriser for the Glass descriptions"""
+    return TfidfVectorizer(stop_words=STOPWORDS, **TFIDF_PARAMS)
+
+
+def corpus_fingerprint(corpus):
+    """Hash of a corpus and the vectoriser parameters (used as cache key)"""
+    fingerprint = hashlib.sha1(json.dumps(TFIDF_PARAMS, sort_keys=True).encode())
+    for doc in corpus:
+        fingerprint.update(doc.encode())
+        fingerprint.update(b"\0")
+    return fingerprint.hexdigest()
+
+
+def make_features(corpus, cache_dir=FEATURE_DIR):
+    """Fits the TF-IDF vectoriser and vectorises the corpus
+
+    The sparse feature matrix and the fitted vectoriser (vocabulary and idf
+    weights) are cached in `cache_dir` by corpus so we only vectorise a
+    corpus once.
+
+    Args:
+        corpus (list): descriptions
+        cache_dir (Path or None): where to cache the outputs (None to not cache)
+
+    Returns:
+        fitted vectoriser and feature matrix
+    """
+    if cache_dir is not None:
+        key = corpus_fingerprint(corpus)
+        matrix_path = Path(cache_dir) / f"{key}_features.npz"
+        vectoriser_path = Path(cache_dir) / f"{key}_vectoriser.p"
+
+        if matrix_path.exists() and vectoriser_path.exists():
+            logging.info(f"Loading cached features from {matrix_path}")
+            with open(vectoriser_path, "rb") as f:
+                count_vect = pickle.load(f)
+            return count_vect, sparse.load_npz(matrix_path)
+
+    count_vect = make_vectoriser()
+    X = count_vect.fit_transform(corpus)
+    # Terms dropped by the vectoriser are only kept for introspection
+    if hasattr(count_vect, "stop_words_"):
+        del count_vect.stop_words_
+
+    if cache_dir is not None:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(matrix_path, X.tocsr())
+        with open(vectoriser_path, "wb") as f:
+            pickle.dump(count_vect, f)
+
+    return count_vect, X
+
+
+def make_incremental_model(n_jobs=None):
+    """One vs rest logistic model that can be updated with `partial_fit`"""
+    return OneVsRestClassifier(
+        SGDClassifier(loss="log_loss", random_state=42),
+        n_jobs=n_jobs,
+    )
+
 
-def train_model(gl_sector):
-    """Trains a logistic model on the Glass data"""
-    logging.info(f"Training with {str(len(gl_sector_sample))}")
+def partial_fit_balanced(model, X, labels, classes=None):
+    """Updates an incremental model weighting classes by their frequency
+
+    SGD doesn't support `class_weight="balanced"` with `partial_fit`, so
+    descriptions are weighted inversely to the frequency of their division
+    in the batch instead (as the full retrain is balanced).
+
+    Args:
+        model (OneVsRestClassifier): see `make_incremental_model`
+        X (sparse matrix): features
+        labels (array): divisions
+        classes (array): all divisions (required in the first call)
+    """
+    sample_weight = compute_sample_weight("balanced", labels)
+    with sklearn.config_context(enable_metadata_routing=True):
+        model.estimator.set_partial_fit_request(sample_weight=True)
+        model.partial_fit(X, labels, classes=classes, sample_weight=sample_weight)
+    return model
+
+
+def train_model(
+    gl_sector, n_jobs=None, incremental=False, n_epochs=5, cache_dir=FEATURE_DIR
+):
+    """Trains a logistic model on the Glass data
+
+    Args:
+        gl_sector (df): Glass descriptions and their division
+        n_jobs (int): number of processes used to fit the one vs rest models
+        incremental (bool): if we fit an SGD model that can be updated with
+            `update_model` instead of a liblinear one
+        n_epochs (int): passes over the training data for the SGD model
+        cache_dir (Path or None): where to cache the TF-IDF features
+    """
+    logging.info(f"Training with {str(len(gl_sector))}")
 
     # Count vectorise the descriptions
     logging.info("Pre-processing")
     # One hot encoding for labels
     # Create array of divisions
-    labels = np.array(np.array(gl_sector_sample["division"]))
+    labels = np.array(np.array(gl_sector["division"]))
     # Create the features (target and corpus)
     lb = LabelBinarizer()
     lb.fit(labels)
     y = lb.transform(labels)
 
     # Count vectorised corpus
-    corpus = list(gl_sector_sample["description"])
-    count_vect = TfidfVectorizer(
-        stop_words=STOPWORDS,
-        ngram_range=(1, 2),
-        min_df=20,
-        max_df=0.1,
-        max_features=10000,
-    ).fit(corpus)
-
-    X = count_vect.transform(corpus)
+    corpus = list(gl_sector["description"])
+    count_vect, X = make_features(corpus, cache_dir=cache_dir)
 
     logging.info(X.shape)
 
@@ -63,18 +172,198 @@ def train_model(gl_sector):
         X, y, test_size=0.2, random_state=42
     )
 
-    # Initialise the model
-    m = OneVsRestClassifier(
-        LogisticRegression(C=1, class_weight="balanced", solver="liblinear")
-    )
-
     # Train the model
     logging.info("Training")
-    m.fit(X_train, Y_train)
+    if incremental:
+        m = make_incremental_model(n_jobs=n_jobs)
+        labels_train = lb.inverse_transform(Y_train)
+        for _ in range(n_epochs):
+            partial_fit_balanced(m, X_train, labels_train, classes=lb.classes_)
+    else:
+        m = OneVsRestClassifier(
+            LogisticRegression(C=1, class_weight="balanced", solver="liblinear"),
+            n_jobs=n_jobs,
+        )
+        m.fit(X_train, Y_train)
 
     return lb, count_vect, X_test, Y_test, m
 
 
+def update_model(model, count_vect, gl_sector_new):
+    """Updates an incremental model (see `train_model`) with new descriptions
+
+    The vectoriser is not refitted so new descriptions are represented with
+    the existing vocabulary and idf weights.
+
+    Args:
+        model (OneVsRestClassifier): model fitted with `incremental=True`
+        count_vect (TfidfVectorizer): fitted vectoriser
+        gl_sector_new (df): new Glass descriptions and their division
+    """
+    known = gl_sector_new["division"].isin(model.classes_)
+    if (~known).sum() > 0:
+        logging.info(f"Dropping {(~known).sum()} descriptions in unseen divisions")
+    gl_sector_new = gl_sector_new.loc[known]
+
+    X = count_vect.transform(gl_sector_new["description"])
+    partial_fit_balanced(model, X, np.array(gl_sector_new["division"]))
+
+    return model
+
+
+def save_model(lb, count_vect, model, path=MODEL_DIR):
+    """Saves the fitted label binarizer, vectoriser and model"""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / "model.p", "wb") as f:
+        pickle.dump(
+            {"label_binarizer": lb, "vectoriser": count_vect, "model": model}, f
+        )
+
+
+def load_model(path=MODEL_DIR):
+    """Loads the label binarizer, vectoriser and model saved with `save_model`"""
+    with open(Path(path) / "model.p", "rb") as f:
+        saved = pickle.load(f)
+    return saved["label_binarizer"], saved["vectoriser"], saved["model"]
+
+
+_SCORING_MODEL = {}
+
+
+def _init_scoring_worker(model_dir):
+    """Loads the sector model in a worker"""
+    lb, count_vect, model = load_model(model_dir)
+    _SCORING_MODEL.update(lb=lb, count_vect=count_vect, model=model)
+
+
+def _score_chunk(chunk, top_k=None, thres=None):
+    """Predicts division probabilities for a chunk of descriptions in a worker
+
+    Probabilities outside the `top_k` of a description or below `thres` are
+    set to 0.
+    """
+    X = _SCORING_MODEL["count_vect"].transform(chunk["description"])
+    probs = _SCORING_MODEL["model"].predict_proba(X).astype("float32")
+
+    if top_k is not None and top_k < probs.shape[1]:
+        top = np.argpartition(-probs, top_k - 1, axis=1)[:, :top_k]
+        keep = np.zeros(probs.shape, dtype=bool)
+        keep[np.arange(len(probs))[:, None], top] = True
+        probs[~keep] = 0
+    if thres is not None:
+        probs[probs <= thres] = 0
+
+    preds = pd.DataFrame(probs, columns=_SCORING_MODEL["lb"].classes_)
+    preds["id_organisation"] = chunk["org_id"].values
+    return preds
+
+
+def write_parquet_atomic(frames, path, empty):
+    """Writes dataframes to a single parquet file atomically
+
+    Frames are appended to a temporary file that is only moved to `path`
+    once complete, so an error never leaves a truncated file in `path`.
+
+    Args:
+        frames (iterable of dfs): dataframes with the same columns
+        path (Path): parquet file
+        empty (callable): returns an empty df with the expected columns,
+            written if there are no frames
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    writer = None
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(
+                frame, schema=writer.schema if writer else None, preserve_index=False
+            )
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+        if writer is None:
+            empty().to_parquet(tmp_path, index=False)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if writer is not None:
+        writer.close()
+    os.replace(tmp_path, path)
+
+
+def _empty_predictions(model_dir):
+    """Predictions with no companies (one column per division)"""
+    lb = load_model(model_dir)[0]
+    preds = pd.DataFrame({division: [] for division in lb.classes_}, dtype="float32")
+    preds["id_organisation"] = pd.Series([], dtype="object")
+    return preds
+
+
+def _iter_predictions(descriptions, model_dir, top_k, thres, n_jobs):
+    """Yields the predictions of each chunk of descriptions in order"""
+    with ProcessPoolExecutor(
+        max_workers=n_jobs, initializer=_init_scoring_worker, initargs=(model_dir,)
+    ) as executor:
+        pending = deque()
+        for n, chunk in enumerate(descriptions):
+            logging.info(f"Predicting divisions for chunk {n}")
+            pending.append(executor.submit(_score_chunk, chunk, top_k, thres))
+            if len(pending) >= 2 * n_jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def predict_divisions(
+    descriptions,
+    output_path=PREDICTED_PATH,
+    model_dir=MODEL_DIR,
+    chunksize=50_000,
+    top_k=None,
+    thres=None,
+    n_jobs=None,
+):
+    """Predicts the divisions of Glass companies in chunks across processes
+
+    Workers load the model saved in `model_dir` once when they start. Chunks
+    of descriptions are streamed to them and their float32 probabilities are
+    written to a parquet file (one column per division, plus
+    `id_organisation`) in the same order as `descriptions` (see
+    `write_parquet_atomic`). The file is written even if there are no
+    descriptions.
+
+    Args:
+        descriptions (df or iterable of dfs): `org_id` and `description`
+        output_path (Path): parquet file with the predictions
+        model_dir (Path): directory with the model saved with `save_model`
+        chunksize (int): descriptions per chunk (if `descriptions` is a df)
+        top_k (int): only keep the top k probabilities of each company
+        thres (float): only keep probabilities above this threshold
+        n_jobs (int): number of worker processes. If None, use all cores.
+    """
+    if isinstance(descriptions, pd.DataFrame):
+        descriptions = [
+            descriptions.iloc[start:start + chunksize]
+            for start in range(0, len(descriptions), chunksize)
+        ]
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    write_parquet_atomic(
+        _iter_predictions(
+            descriptions, model_dir, top_k, thres, n_jobs or os.cpu_count()
+        ),
+        output_path,
+        empty=lambda: _empty_predictions(model_dir),
+    )
+
+    return output_path
+
+
 def validate_results_single(prob_vector, true_label, thres=0.1):
     """Compares predicted labels with actual labels for a single observation
     Args:
@@ -127,16 +416,45 @@ def validate_results_single(prob_vector, true_label, thres=0.1):
 
 def validate_results(pred_df, labels, thres=0.2):
     """Compares predicted labels with actual labels
+
+    Computes the same metrics as `validate_results_single` for all
+    observations at once on the probability matrix.
+
     Args:
         pred_df (df): all prediction probabilities
         labels (series): labels
         thres (float): minimum threshold to consider a sector present in the predictions
     """
+    probs = pred_df.to_numpy()
+    sectors = pred_df.columns
+    labels = np.asarray(labels)
+    rows = np.arange(len(probs))
+
+    true_pos = sectors.get_indexer(labels)
+    if (true_pos == -1).any():
+        missing = set(labels[true_pos == -1])
+        raise KeyError(f"Labels not among the predicted sectors: {missing}")
+    true_prob = probs[rows, true_pos]
+    top_pos = probs.argmax(axis=1)
+
+    # Position of the actual label when sorting probabilities in descending
+    # order (ties in their original order)
+    true_rank = (probs > true_prob[:, None]).sum(axis=1) + (
+        (probs == true_prob[:, None]) & (np.arange(len(sectors)) < true_pos[:, None])
+    ).sum(axis=1)
+
+    section = pd.Series(div_sect_lookup)
+
     out = pd.DataFrame(
-        [
-            validate_results_single(pred_df.iloc[n], labels[n], thres=thres)
-            for n in np.arange(0, len(pred_df))
-        ]
+        {
+            "true_top": top_pos == true_pos,
+            "true_high": true_prob > 0.5,
+            "true_top_5": true_rank < 5,
+            "true_top_10": true_rank < 10,
+            "true_predicted": true_prob > thres,
+            "same_section": section.reindex(sectors[top_pos]).to_numpy()
+            == section.reindex(labels).to_numpy(),
+        }
     )
 
     out["true_label"] = labels
@@ -214,7 +532,7 @@ if __name__ == "__main__":
     ]
 
     # Train model
-    lb, count_vect, X_test, Y_test, model = train_model(gl_sector_sample)
+    lb, count_vect, X_test, Y_test, model = train_model(gl_sector_sample, n_jobs=-1)
 
     # Validation
     test_labels = model.predict_proba(X_test)
@@ -234,12 +552,5 @@ if __name__ == "__main__":
     export_chart(perf_chart, "appendix_model_validation")
 
     # Apply model to population of companies and save results
-    X_all = count_vect.transform(gl_sector["description"])
-
-    # This creates a df with predicted probabilities for all data in the corpus
-    preds_all = pd.DataFrame(model.predict_proba(X_all), columns=lb.classes_)
-    preds_all["id_organisation"] = gl_sector["org_id"]
-    preds_all.to_csv(
-        f"{project_dir}/data/processed/glass_companies_predicted_labels_v2.csv",
-        index=False,
-    )
+    save_model(lb, count_vect, model)
+    predict_divisions(gl_sector[["org_id", "description"]])
@@ -2,13 +2,18 @@
 import json
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from subprocess import Popen, CalledProcessError
 from datetime import datetime
 from itertools import chain
 from pathlib import Path
-from typing import Any, Tuple, List, Dict, Generator
+from typing import Any, Tuple, List, Dict, Generator, Iterable, Optional
 
 from dotenv import find_dotenv, load_dotenv
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import toolz.curried as t
 import tqdm
 
@@ -20,10 +25,25 @@ UserHandle = str
 UserInfo = Dict[str, Any]
 Tweets = List[Dict[str, Any]]
 
+TWEET_SCHEMA = pa.schema(
+    [
+        ("created_at", pa.string()),
+        ("id", pa.int64()),
+        ("text", pa.string()),
+        ("user", pa.string()),
+        ("followers_count", pa.int64()),
+        ("friends_count", pa.int64()),
+        ("retweet_count", pa.int64()),
+        ("favorite_count", pa.int64()),
+        ("lang", pa.string()),
+        # Lower-cased screen name, tweets are sorted by it within a file
+        ("user_lower", pa.string()),
+    ]
+)
 
-def get_all(path: Path) -> Generator[List[Tweets], None, None]:
-    """Generator yielding tweet data one account at a time."""
 
+def get_account_files(path: Path) -> List[Path]:
+    """Files with the tweet data of each account."""
     keys = t.pipe(
         path.glob("[a-zA-Z0-9]*"),
         t.map(lambda p: p.rglob("*")),
@@ -33,6 +53,13 @@ def get_all(path: Path) -> Generator[List[Tweets], None, None]:
     )
 
     logging.info(f"{len(keys)} twitter handles.")
+    return keys
+
+
+def get_all(path: Path) -> Generator[List[Tweets], None, None]:
+    """Generator yielding tweet data one account at a time."""
+
+    keys = get_account_files(path)
 
     for organisation in keys:
         logging.info(organisation)
@@ -86,6 +113,122 @@ def process_org_tweets(tweets: List[Tweets]) -> Tuple[UserInfo, Tweets]:
     )
 
 
+def process_org_file(path: Path) -> Optional[Tuple[UserInfo, Tweets]]:
+    """Load and process the tweets of an account (None if it has no tweets)."""
+    with path.open() as f:
+        tweets = json.load(f)
+    if tweets == []:
+        return None
+
+    user, user_tweets = process_org_tweets(tweets)
+    if user_tweets == []:
+        return None
+    return user, user_tweets
+
+
+def write_tweet_batch(
+    tweets: Tweets, path: Path, row_group_size: int = 10_000
+) -> pd.DataFrame:
+    """Write a batch of processed tweets to a parquet file, sorted by user.
+
+    Returns:
+        Row groups of `path` containing the tweets of each (lower-cased) user
+    """
+    rows = sorted(
+        ({**tweet, "user_lower": tweet["user"].lower()} for tweet in tweets),
+        key=lambda tweet: tweet["user_lower"],
+    )
+    pq.write_table(
+        pa.Table.from_pylist(rows, schema=TWEET_SCHEMA),
+        path,
+        row_group_size=row_group_size,
+    )
+
+    return pd.DataFrame(
+        {
+            "user_lower": [row["user_lower"] for row in rows],
+            "row_group": np.arange(len(rows)) // row_group_size,
+        }
+    ).drop_duplicates().assign(file=path.name)
+
+
+def write_users(users: List[UserInfo], out_path: Path) -> None:
+    """Write user info as JSON lines, indexed by lower-cased screen name.
+
+    The index (`user_index.json`) maps each lower-cased screen name to the
+    byte offsets of its lines in `users.jsonl`.
+    """
+    index: Dict[str, List[int]] = {}
+    with (out_path / "users.jsonl").open("wb") as f:
+        for user in users:
+            index.setdefault(user["screen_name"].lower(), []).append(f.tell())
+            f.write(json.dumps(user).encode() + b"\n")
+
+    with (out_path / "user_index.json").open("w") as f:
+        json.dump(index, f)
+
+
+def ingest_tweets(
+    account_files: Iterable[Path],
+    out_path: Path,
+    batch_size: int = 500_000,
+    n_jobs: Optional[int] = None,
+) -> List[UserInfo]:
+    """Process account files across worker processes, storing tweets as parquet.
+
+    Tweets are written to `out_path / "tweets"` in files of about
+    `batch_size` tweets. All the tweets of an account are in the same file.
+    `out_path / "tweet_index.parquet"` holds the file and row groups of each
+    (lower-cased) user.
+
+    Args:
+        account_files: Files with the tweet data of each account.
+        out_path: Output directory.
+        batch_size: Minimum number of tweets per file.
+        n_jobs: Number of worker processes. If None, use all cores.
+
+    Returns:
+        User info of accounts with tweets
+    """
+    tweets_path = out_path / "tweets"
+    tweets_path.mkdir(parents=True, exist_ok=True)
+    for old_file in tweets_path.glob("*.parquet"):
+        old_file.unlink()
+
+    users: List[UserInfo] = []
+    index: List[pd.DataFrame] = []
+    batch: Tweets = []
+    n_files = 0
+    with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+        processed = executor.map(process_org_file, account_files, chunksize=100)
+        for account in tqdm.tqdm(processed, desc="Processed"):
+            if account is None:
+                continue
+            user, user_tweets = account
+            users.append(user)
+            batch.extend(user_tweets)
+
+            if len(batch) >= batch_size:
+                index.append(
+                    write_tweet_batch(
+                        batch, tweets_path / f"part-{n_files:05d}.parquet"
+                    )
+                )
+                n_files += 1
+                batch = []
+
+    if batch or n_files == 0:
+        index.append(
+            write_tweet_batch(batch, tweets_path / f"part-{n_files:05d}.parquet")
+        )
+
+    pd.concat(index, ignore_index=True).to_parquet(
+        out_path / "tweet_index.parquet", index=False
+    )
+
+    return users
+
+
 def download_tweets_from_s3(path: Path) -> None:
     """Download scraped tweets to `path` from S3 store."""
     cmd = " ".join(
@@ -128,19 +271,7 @@ if __name__ == "__main__":
     download_tweets_from_s3(in_path)
 
     # Process tweet data
-    tweets: List[Tuple[UserInfo, Tweets]] = t.pipe(
-        get_all(in_path),
-        t.curry(tqdm.tqdm, desc="Downloaded"),
-        t.filter(lambda x: x != []),
-        t.map(process_org_tweets),
-        t.filter(lambda x: x[1] != []),
-        list,
-    )
-
-    # Export tweets
-    with (out_path / "tweets.json").open("w") as f:
-        json.dump([user_tweets for _, user_tweets in tweets], f)
+    users = ingest_tweets(get_account_files(in_path), out_path)
 
     # Export users
-    with (out_path / "users.json").open("w") as f:
-        json.dump([user for user, _ in tweets], f)
+    write_users(users, out_path)
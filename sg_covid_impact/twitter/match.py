@@ -1,10 +1,15 @@
 """Match tweets to organisations."""
+import os
 from collections import Counter
-from typing import Any, Tuple, List, Set, Dict, Optional, KeysView
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Any, Iterable, Tuple, List, Set, Dict, Optional
 
+import numpy as np
 import toolz.curried as t
 import tqdm
-from fuzzywuzzy import process, fuzz
+from fuzzywuzzy import fuzz, utils
+from rapidfuzz import fuzz as rfuzz, process
 
 # Type aliases
 UserHandle = str
@@ -29,59 +34,102 @@ def user_website_lookup(users: List[UserInfo]) -> Dict[UserHandle, str]:
 
 
 def build_blacklist(matches: Dict[str, Dict[UserHandle, int]]) -> Set[UserHandle]:
+    """Accounts matched to more than 5 websites."""
     return t.pipe(
-        matches.values(),
-        t.merge_with(len),
-        Counter,
-        lambda c: c.most_common(),
+        Counter(chain.from_iterable(matches.values())).items(),
         t.filter(lambda x: x[1] > 5),
         t.map(t.first),
         set,
     )
 
 
+def process_name(name: str) -> str:
+    """Normalise a candidate screen name as `fuzzywuzzy.process.extract` does."""
+    return utils.full_process(name, force_ascii=True)
+
+
+def process_website(website: str) -> str:
+    """Normalise a website (the query) as `fuzzywuzzy.process.extract` does."""
+    return utils.full_process(utils.full_process(website), force_ascii=True)
+
+
+def _wratio(name: str, other: str, **kwargs) -> int:
+    """fuzzywuzzy `WRatio` of normalised names (for `rapidfuzz.process`).
+
+    rapidfuzz's own `WRatio` scores partial matches differently, so
+    fuzzywuzzy's is kept to resolve the same handles. Extra arguments (e.g.
+    `score_cutoff`) are ignored.
+    """
+    return fuzz.WRatio(name, other, full_process=False)
+
+
 def extract_twitter_id(
-    item: Tuple[str, Dict[UserHandle, int]], lookup: Dict[UserHandle, str]
+    item: Tuple[str, Dict[UserHandle, int]],
+    lookup: Dict[UserHandle, str],
+    names: Optional[Dict[UserHandle, str]] = None,
 ) -> Tuple[str, Optional[UserHandle]]:
-    """Extract twitter screen-name for website from list of potentials"""
+    """Extract twitter screen-name for website from list of potentials
+
+    Args:
+        item: Website and its candidate accounts.
+        lookup: Website in the profile of each account.
+        names: Normalised screen name of each account (see `process_name`).
+            Computed for the candidates if not given.
+    """
     website, match = item
     n_keys = len(match.keys())
 
     if n_keys == 0:
         return (website, None)
     elif n_keys == 1:  # Take what we can get
-        return (website, match.popitem()[0])
+        return (website, next(iter(match)))
     else:
-        similarities = process.extract(website, match.keys())
+        keys = list(match.keys())
+        if names is None:
+            names = {key: process_name(key) for key in keys}
+        similarities = process.cdist(
+            [process_website(website)],
+            [names[key] for key in keys],
+            scorer=_wratio,
+            processor=None,
+        )[0]
         threshold = 70
-        if similarities[0][1] >= threshold:
-            return (website, similarities[0][0])
+        # First key with the highest similarity (ties as in `process.extract`)
+        best = similarities.argmax()
+        if similarities[best] >= threshold:
+            return (website, keys[best])
         else:  # Check website for user
-            potentials = website_in_account(website, match.keys(), lookup, threshold)
+            potentials = website_in_account(website, keys, lookup, threshold)
             return (website, potentials[1])
 
 
 def website_in_account(
     website: str,
-    keys: KeysView[UserHandle],
+    keys: Iterable[UserHandle],
     lookup: Dict[UserHandle, str],
     threshold: int,
 ) -> Tuple[str, Optional[str]]:
-    """Return twitter screen name in `lookup` that best matches `website`."""
-    result = t.pipe(
-        keys,
-        t.map(lambda x: (x, lookup.get(x))),  # Get websites of candidates (if existing)
-        t.filter(lambda x: x[1] is not None),
-        # Similarities of websites
-        t.map(lambda x: (x[0], fuzz.ratio(website, x[1]))),
-        t.filter(lambda name_score: name_score[1] >= threshold),
-        # Sort and get best
-        t.curry(sorted, key=lambda x: x[1]),
-        t.map(t.first),  # Name not score
-        list,
-        t.get(0, default=None),
-    )
-    return (website, result)
+    """Return twitter screen name in `lookup` that best matches `website`.
+
+    NOTE: Of the candidates above `threshold`, the first with the lowest
+    similarity is returned.
+    """
+    # Websites of candidates (if existing)
+    candidates = [(key, lookup.get(key)) for key in keys]
+    candidates = [(key, url) for key, url in candidates if url is not None]
+    if len(candidates) == 0:
+        return (website, None)
+
+    urls = [url for _, url in candidates]
+    # Same as fuzzywuzzy's `ratio` (0 if either string is empty)
+    similarities = np.round(process.cdist([website], urls, scorer=rfuzz.ratio)[0])
+    similarities[[len(website) == 0 or len(url) == 0 for url in urls]] = 0
+    above_threshold = np.flatnonzero(similarities >= threshold)
+    if len(above_threshold) == 0:
+        return (website, None)
+
+    best = above_threshold[similarities[above_threshold].argmin()]
+    return (website, candidates[best][0])
 
 
 def filter_accounts(
@@ -90,3 +138,71 @@ def filter_accounts(
     """Remove blacklisted accounts."""
     website, match = item
     return (website, t.keyfilter(lambda k: k not in blacklist, match))
+
+
+_RESOLVER = {}
+
+
+def _init_resolver(
+    blacklist: Set[UserHandle],
+    lookup: Dict[UserHandle, str],
+    names: Dict[UserHandle, str],
+) -> None:
+    """Stores the blacklist, user website lookup and name index in a worker."""
+    _RESOLVER["blacklist"] = blacklist
+    _RESOLVER["lookup"] = lookup
+    _RESOLVER["names"] = names
+
+
+def _resolve_chunk(
+    items: List[Tuple[str, Dict[UserHandle, int]]],
+) -> List[Tuple[str, Optional[UserHandle]]]:
+    """Extract twitter screen-names for a chunk of websites in a worker."""
+    return [
+        extract_twitter_id(
+            filter_accounts(item, _RESOLVER["blacklist"]),
+            _RESOLVER["lookup"],
+            _RESOLVER["names"],
+        )
+        for item in items
+    ]
+
+
+def resolve_twitter_ids(
+    matches: Dict[str, Dict[UserHandle, int]],
+    blacklist: Set[UserHandle],
+    lookup: Dict[UserHandle, str],
+    chunksize: int = 1_000,
+    n_jobs: Optional[int] = None,
+) -> Dict[str, UserHandle]:
+    """Extract twitter screen-name for each website across worker processes.
+
+    Args:
+        matches: Candidate accounts of each website.
+        blacklist: Accounts to ignore (see `build_blacklist`).
+        lookup: Website in the profile of each account.
+        chunksize: Number of websites sent to a worker at a time.
+        n_jobs: Number of worker processes. If None, use all cores.
+
+    Returns:
+        Twitter screen-name of each website (if found)
+    """
+    # Normalise each candidate screen name once
+    names = {
+        handle: process_name(handle)
+        for handle in set(chain.from_iterable(matches.values()))
+    }
+    with ProcessPoolExecutor(
+        max_workers=n_jobs or os.cpu_count(),
+        initializer=_init_resolver,
+        initargs=(blacklist, lookup, names),
+    ) as executor:
+        resolved = executor.map(
+            _resolve_chunk, t.partition_all(chunksize, matches.items())
+        )
+        return t.pipe(
+            resolved,
+            chain.from_iterable,
+            dict,
+            t.valfilter(lambda v: v is not None),
+        )
@@ -1,3 +1,6 @@
+from collections import Counter
+from itertools import chain
+
 import pandas as pd
 
 
@@ -6,6 +9,25 @@ def flatten_list(_list):
     return [x for el in _list for x in el]
 
 
+def _make_freq_series(freqs, normalised):
+    """Sort element frequencies, most frequent first
+
+    Ties keep the order in which elements first occur (`value_counts` did
+    not guarantee an order for ties)
+    """
+    freqs = freqs.sort_values(ascending=False, kind="mergesort")
+    if normalised:
+        return freqs / freqs.sum()
+    return freqs
+
+
 def flatten_freq(_list, normalised=False):
-    """Flatten a nested list and return element frequencies"""
-    return pd.Series(flatten_list(_list)).value_counts(normalised)
+    """Flatten a nested list and return element frequencies
+
+    Elements are counted as we iterate over the nested list, so the flattened
+    list is never created (the output is the same as `value_counts` on it,
+    up to the order of ties)
+    """
+    counts = Counter(chain.from_iterable(_list))
+    freqs = pd.Series(list(counts.values()), index=list(counts.keys()), dtype="int64")
+    return _make_freq_series(freqs, normalised)
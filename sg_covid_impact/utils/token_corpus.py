@@ -0,0 +1,122 @@
+"""Compact on-disk format for tokenised corpora.
+
+A corpus is a directory with:
+- `vocabulary.json`: list of tokens
+- `doc_ids.json`: list of document ids
+- `tokens.bin`: int32 token ids (positions in the vocabulary) of all documents
+- `offsets.npy`: start of each document in `tokens.bin` (plus the end of the last)
+
+Token ids are memory-mapped so documents are only read when we iterate
+over them.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, Iterator, List, Mapping, Tuple, Union
+
+import numpy as np
+
+Documents = Union[Mapping[Hashable, List[str]], Iterable[Tuple[Hashable, List[str]]]]
+
+
+def _to_json(x):
+    """Convert numpy scalars (e.g. document ids) to python objects for json"""
+    return x.item()
+
+
+def write_token_corpus(documents: Documents, path: Path) -> "TokenCorpus":
+    """Write tokenised documents to a corpus directory, one document at a time.
+
+    Args:
+        documents: Document id -> tokens (dict or iterable of pairs).
+        path: Corpus directory.
+
+    Returns:
+        The corpus in `path`
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    if isinstance(documents, Mapping):
+        documents = documents.items()
+
+    vocabulary: Dict[str, int] = {}
+    doc_ids = []
+    offsets = [0]
+    with open(path / "tokens.bin", "wb") as f:
+        for doc_id, tokens in documents:
+            token_ids = [
+                vocabulary.setdefault(token, len(vocabulary)) for token in tokens
+            ]
+            np.asarray(token_ids, dtype="int32").tofile(f)
+            doc_ids.append(doc_id)
+            offsets.append(offsets[-1] + len(token_ids))
+
+    np.save(path / "offsets.npy", np.asarray(offsets, dtype="int64"))
+    with open(path / "vocabulary.json", "w") as f:
+        json.dump(list(vocabulary), f)
+    with open(path / "doc_ids.json", "w") as f:
+        json.dump(doc_ids, f, default=_to_json)
+
+    return TokenCorpus(path)
+
+
+class TokenCorpus:
+    """Memory-mapped tokenised corpus (see `write_token_corpus`).
+
+    Iterating over a corpus lazily yields the tokens of each document, so it
+    can be iterated over repeatedly (e.g. by `gensim.models.Phrases`).
+
+    Args:
+        path: Corpus directory.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / "vocabulary.json", "r") as f:
+            self.vocabulary: List[str] = json.load(f)
+        with open(self.path / "doc_ids.json", "r") as f:
+            self.doc_ids: List[Hashable] = json.load(f)
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        self.tokens = (
+            np.memmap(self.path / "tokens.bin", dtype="int32", mode="r")
+            if self.offsets[-1] > 0
+            else np.zeros(0, dtype="int32")
+        )
+        # Positions of the documents in this corpus (all unless subset)
+        self.positions = np.arange(len(self.doc_ids))
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __iter__(self) -> Iterator[List[str]]:
+        for token_ids in self.iter_token_ids():
+            yield [self.vocabulary[i] for i in token_ids]
+
+    def iter_token_ids(self) -> Iterator[np.ndarray]:
+        """Yield the token ids of each document."""
+        for pos in self.positions:
+            start, end = self.offsets[pos], self.offsets[pos + 1]
+            yield self.tokens[start:end]
+
+    def items(self) -> Iterator[Tuple[Hashable, List[str]]]:
+        """Yield (document id, tokens) pairs."""
+        return zip(self.ids(), iter(self))
+
+    def ids(self) -> List[Hashable]:
+        """Ids of the documents in the corpus."""
+        return [self.doc_ids[pos] for pos in self.positions]
+
+    def subset(self, doc_ids: Iterable[Hashable]) -> "TokenCorpus":
+        """Corpus with the documents in `doc_ids` (sharing the memory map)."""
+        doc_ids = set(doc_ids)
+        corpus = TokenCorpus.__new__(TokenCorpus)
+        corpus.__dict__.update(self.__dict__)
+        corpus.positions = np.asarray(
+            [pos for pos in self.positions if self.doc_ids[pos] in doc_ids],
+            dtype="int64",
+        )
+        return corpus
+
+    def to_dict(self) -> Dict[Hashable, List[str]]:
+        """Document id -> tokens."""
+        return dict(self.items())
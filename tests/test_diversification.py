@@ -0,0 +1,101 @@
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+from sg_covid_impact.diversification import (
+    make_diversification_options,
+    make_neighbor_shares,
+)
+
+
+def make_neighbor_shares_reference(network, exposure_ranking, month):
+    """Loop-based implementation of make_neighbor_shares"""
+    division_exposure_month = {
+        k[0]: v for k, v in exposure_ranking.items() if k[1] == month
+    }
+
+    neighb = []
+    neighb_n = {}
+    for x in network.nodes:
+        neighbors = list(nx.neighbors(network, x))
+        neighbor_exposures = pd.Series(
+            [division_exposure_month[n] for n in neighbors], name=x
+        ).value_counts(normalize=True)
+        neighb.append(neighbor_exposures)
+        neighb_n[x] = len(neighbors)
+
+    exposure_sorted = (
+        pd.Series(division_exposure_month).sort_values(ascending=False).index.tolist()
+    )
+
+    df = pd.DataFrame(neighb)
+    df["neighbour_n"] = df.index.map(neighb_n)
+
+    return df.loc[exposure_sorted].fillna(0)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_make_neighbor_shares_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    network = nx.gnp_random_graph(40, 0.1, seed=seed)
+    network = nx.relabel_nodes(network, {n: f"{n:02d}" for n in network.nodes})
+    months = ["2020-03-01", "2020-04-01"]
+    exposure_ranking = {
+        (node, month): int(rng.integers(1, 6))
+        for node in network.nodes
+        for month in months
+    }
+
+    for month in months:
+        result = make_neighbor_shares(network, exposure_ranking, month)
+        expected = make_neighbor_shares_reference(network, exposure_ranking, month)
+        pd.testing.assert_frame_equal(
+            result,
+            expected[result.columns],
+            check_dtype=False,
+            check_column_type=False,
+            check_names=False,
+        )
+        assert set(result.columns) == set(expected.columns)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_make_diversification_options_path_lengths(seed):
+    rng = np.random.default_rng(seed)
+    network = nx.connected_watts_strogatz_graph(30, 4, 0.3, seed=seed)
+    exposure_ranking = {(node, "2020-04-01"): rng.integers(1, 6) for node in network}
+
+    result = make_diversification_options(
+        network,
+        exposure_ranking,
+        "2020-04-01",
+        exposed=[4, 5],
+        safe=[1, 2],
+        path_lengths=dict(nx.all_pairs_shortest_path_length(network)),
+    )
+    expected = make_diversification_options(
+        network, exposure_ranking, "2020-04-01", exposed=[4, 5], safe=[1, 2]
+    )
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_make_diversification_options_disconnected():
+    network = nx.Graph([("01", "02"), ("03", "04")])
+    exposure_ranking = {
+        ("01", "2020-04-01"): 5,
+        ("02", "2020-04-01"): 1,
+        ("03", "2020-04-01"): 1,
+        ("04", "2020-04-01"): 3,
+    }
+
+    with pytest.raises(nx.NetworkXNoPath):
+        make_diversification_options(
+            network,
+            exposure_ranking,
+            "2020-04-01",
+            exposed=[5],
+            safe=[1],
+            path_lengths=dict(nx.all_pairs_shortest_path_length(network)),
+        )
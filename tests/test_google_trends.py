@@ -0,0 +1,104 @@
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from sg_covid_impact.flows.google_trends.utils import RequestCache, TokenBucket
+
+PAYLOAD = {"timeframe": "2020-01-01 2021-01-01", "geo": "GB-SCT"}
+
+
+def make_result(keywords, n=5):
+    """Interest over time as returned by pytrends"""
+    return pd.DataFrame(
+        {
+            **{keyword: range(n) for keyword in keywords},
+            "isPartial": [False] * n,
+        },
+        index=pd.date_range("2020-01-05", periods=n, freq="W"),
+    )
+
+
+def test_round_trip(tmp_path):
+    cache = RequestCache(str(tmp_path / "cache.db"))
+    result = make_result(["Food bank", "furlough"])
+
+    assert cache.get(["Food bank", "furlough"], PAYLOAD) is None
+    cache.put(["Food bank", "furlough"], PAYLOAD, result)
+
+    pd.testing.assert_frame_equal(cache.get(["Food bank", "furlough"], PAYLOAD), result)
+    # Results persist between cache instances
+    cached = RequestCache(str(tmp_path / "cache.db")).get(
+        ["Food bank", "furlough"], PAYLOAD
+    )
+    pd.testing.assert_frame_equal(cached, result)
+
+
+def test_keywords_are_normalised(tmp_path):
+    cache = RequestCache(str(tmp_path / "cache.db"))
+    cache.put(["Food bank"], PAYLOAD, make_result(["Food bank"]))
+
+    cached = cache.get(["food  BANK"], PAYLOAD)
+
+    # Columns are named after the keywords as requested
+    assert cached.columns.tolist() == ["food  BANK", "isPartial"]
+    assert cache.get(["food bank"], {**PAYLOAD, "geo": "GB"}) is None
+
+
+def test_empty_results_are_not_cached(tmp_path):
+    cache = RequestCache(str(tmp_path / "cache.db"))
+
+    cache.put(["furlough"], PAYLOAD, pd.DataFrame())
+
+    assert cache.get(["furlough"], PAYLOAD) is None
+
+
+def test_expired_results(tmp_path):
+    cache = RequestCache(str(tmp_path / "cache.db"), ttl=-1)
+    cache.put(["furlough"], PAYLOAD, make_result(["furlough"]))
+
+    assert cache.get(["furlough"], PAYLOAD) is None
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = RequestCache(str(tmp_path / "cache.db"))
+    keywords = [["food bank"], ["furlough"], ["takeaway"]]
+    for keyword in keywords[:2]:
+        cache.put(keyword, PAYLOAD, make_result(keyword))
+    cache.get(keywords[0], PAYLOAD)
+
+    # Only room for the most recently used result and the new one
+    cache.max_bytes = sum(
+        len(pickle.dumps(make_result(keyword), protocol=4))
+        for keyword in [keywords[0], keywords[2]]
+    )
+    cache.put(keywords[2], PAYLOAD, make_result(keywords[2]))
+
+    assert cache.get(keywords[0], PAYLOAD) is not None
+    assert cache.get(keywords[1], PAYLOAD) is None
+    assert cache.get(keywords[2], PAYLOAD) is not None
+
+
+def test_backup(tmp_path):
+    cache = RequestCache(str(tmp_path / "cache.db"))
+    result = make_result(["furlough"])
+    cache.put(["furlough"], PAYLOAD, result)
+
+    cache.backup(str(tmp_path / "backup.db"))
+
+    backup = RequestCache(str(tmp_path / "backup.db"))
+    pd.testing.assert_frame_equal(backup.get(["furlough"], PAYLOAD), result)
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(rate=50, capacity=2)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: bucket.acquire(), range(12)))
+    elapsed = time.monotonic() - start
+
+    # The first two tokens are available straight away
+    assert elapsed >= 10 / 50 * 0.9
+    assert elapsed < 1
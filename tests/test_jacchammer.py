@@ -0,0 +1,140 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sg_covid_impact.flows.jacchammer.utils import (
+    diff_previous_run,
+    make_block_comparisons,
+    make_first_token_keys,
+    make_postcode_keys,
+    partition_comparisons,
+    restrict_comparisons,
+)
+
+
+def comparison_pairs(comparisons):
+    """Count of each (x, y) pair in `comparisons`"""
+    return Counter((i, j) for x, y in comparisons for i in x for j in y)
+
+
+def make_keys(rng, n, n_keys=8, p_missing=0.2):
+    """Random blocking keys (some positions have none, some have two)"""
+    keys = pd.DataFrame(
+        {
+            "position": np.concatenate([np.arange(n), rng.integers(0, n, n // 4)]),
+            "key": rng.integers(0, n_keys, n + n // 4).astype(str),
+        }
+    )
+    return keys.loc[rng.random(len(keys)) > p_missing].drop_duplicates()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_make_block_comparisons(seed):
+    rng = np.random.default_rng(seed)
+    n_x, n_y = 40, 30
+    # Keys only the x (or y) side has are not blocks
+    keys_x, keys_y = make_keys(rng, n_x), make_keys(rng, n_y, n_keys=10)
+
+    comparisons, block_stats = make_block_comparisons(keys_x, keys_y, n_x, n_y)
+
+    shared = keys_x.merge(keys_y, on="key")
+    blocked_x = set(shared.position_x)
+    blocked_y = set(shared.position_y)
+    expected = {
+        (i, j)
+        for i in range(n_x)
+        for j in range(n_y)
+        if j not in blocked_y or i not in blocked_x
+    } | set(zip(shared.position_x, shared.position_y))
+
+    pairs = comparison_pairs(comparisons)
+    assert set(pairs) == expected
+    # Pairs are only compared more than once if they share several keys
+    n_shared = Counter(zip(shared.position_x, shared.position_y))
+    assert all(n == n_shared.get(pair, 1) for pair, n in pairs.items())
+    assert block_stats.n_pairs.sum() == len(shared)
+
+
+@pytest.mark.parametrize("n_partitions", [1, 3, 8])
+def test_partition_comparisons(n_partitions):
+    rng = np.random.default_rng(0)
+    comparisons = [
+        (np.arange(n_x), rng.choice(100, n_y, replace=False))
+        for n_x, n_y in [(50, 40), (3, 2), (10, 10), (1, 1)]
+    ]
+
+    partitions = partition_comparisons(comparisons, n_partitions)
+
+    assert len(partitions) == n_partitions
+    assert comparison_pairs(
+        [comparison for partition in partitions for comparison in partition]
+    ) == comparison_pairs(comparisons)
+
+
+def test_partition_no_comparisons():
+    assert partition_comparisons([], 4) == [[]]
+
+
+def test_make_postcode_keys():
+    names = pd.Series(["acme", "bakery", "zoo"], index=["a", "b", "c"])
+    postcodes = pd.DataFrame(
+        {
+            "id": ["a", "a", "a", "b", "d"],
+            "postcode": ["eh1 1ab", "EH11AB", "G2 3CD", None, "EH1 1AB"],
+        }
+    )
+
+    keys = make_postcode_keys(names, postcodes)
+
+    assert sorted(zip(keys.position, keys.key)) == [(0, "EH1"), (0, "G2")]
+
+
+def test_make_first_token_keys():
+    names = pd.Series(["acme ltd", "acme", None, "zoo"])
+
+    keys = make_first_token_keys(names)
+
+    assert list(zip(keys.position, keys.key)) == [(0, "acme"), (1, "acme"), (3, "zoo")]
+
+
+def test_diff_previous_run():
+    previous_names_x = pd.Series(
+        ["acme", "acme trading", "bakery", "zoo"], index=["1", "1", "2", "3"]
+    )
+    previous_names_y = pd.Series(["acme", "bakery", "zoo"], index=["a", "b", "c"])
+    previous_matches = pd.DataFrame(
+        {"org_id": ["a", "b", "c"], "company_number": ["1", "2", "3"]}
+    )
+    # Company 1 dropped a name, company 4 is new and org c changed its name
+    names_x = pd.Series(["acme", "bakery", "zoo", "new"], index=["1", "2", "3", "4"])
+    names_y = pd.Series(["acme", "bakery", "zoos", "dog"], index=["a", "b", "c", "d"])
+
+    new_x, new_y, valid_matches = diff_previous_run(
+        names_x, names_y, previous_names_x, previous_names_y, previous_matches
+    )
+
+    assert new_x.tolist() == [False, False, False, True]
+    assert new_y.tolist() == [True, False, True, True]
+    assert valid_matches.org_id.tolist() == ["b"]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_restrict_comparisons(seed):
+    rng = np.random.default_rng(seed)
+    n_x, n_y = 40, 30
+    comparisons, _ = make_block_comparisons(
+        make_keys(rng, n_x), make_keys(rng, n_y), n_x, n_y
+    )
+    new_x, new_y = rng.random(n_x) < 0.2, rng.random(n_y) < 0.2
+
+    restricted = comparison_pairs(restrict_comparisons(comparisons, new_x, new_y))
+
+    assert restricted == Counter(
+        {
+            (i, j): n
+            for (i, j), n in comparison_pairs(comparisons).items()
+            if new_x[i] or new_y[j]
+        }
+    )
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sg_covid_impact.utils.list_utils import flatten_freq, flatten_list
+
+
+def flatten_freq_reference(_list, normalised=False):
+    """Frequencies of the elements in the flattened list"""
+    return pd.Series(flatten_list(_list)).value_counts(normalised)
+
+
+@pytest.mark.parametrize("normalised", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_flatten_freq_matches_reference(seed, normalised):
+    rng = np.random.default_rng(seed)
+    nested = [
+        list(rng.choice(list("abcdefghij"), size=rng.integers(0, 10)))
+        for _ in range(50)
+    ]
+
+    result = flatten_freq(nested, normalised)
+    expected = flatten_freq_reference(nested, normalised)
+
+    # Same frequencies, sorted from most to least frequent
+    pd.testing.assert_series_equal(
+        result.sort_index(), expected.sort_index(), check_names=False
+    )
+    assert result.is_monotonic_decreasing
+
+
+def test_flatten_freq_ties_keep_first_occurrence():
+    nested = [["b", "a"], ["c"], ["a", "b", "d"], ["c"]]
+
+    assert flatten_freq(nested).index.tolist() == ["b", "a", "c", "d"]
+
+
+def test_flatten_freq_empty():
+    assert flatten_freq([]).empty
+    assert flatten_freq([[], []], normalised=True).empty
@@ -0,0 +1,156 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+from sg_covid_impact.modelling import fit_regression, make_lagged_web
+
+
+def make_lagged_web_reference(var, name):
+    """Month by month implementation of make_lagged_web"""
+    results = []
+
+    var_ = var.query("month_year>'2020-03-01'")
+
+    for m in set(var_["month_year"]):
+        pre = var_.query(f"month_year<'{m}'")
+        stat = pre.groupby(["geo_cd", "variable"])["value"].mean()
+        stat.name = m
+        results.append(stat)
+
+    results_df = pd.concat(results, axis=1)
+    lagged = (
+        results_df.loc[
+            :, [x > datetime.datetime(2020, 4, 1) for x in results_df.columns]
+        ]
+        .reset_index(drop=False)
+        .melt(id_vars=["geo_cd", "variable"], var_name="month_year")
+        .drop(axis=1, labels=["variable"])
+        .rename(columns={"value": f"{name}_lagged"})
+        .set_index(["geo_cd", "month_year"])
+    )
+    return lagged
+
+
+def make_monthly_variable(seed, n_geos=15):
+    """Random monthly variable with missing values and missing months"""
+    rng = np.random.default_rng(seed)
+    months = pd.date_range("2020-02-01", "2021-01-01", freq="MS")
+    var = pd.DataFrame(
+        [
+            {"geo_cd": f"S{g:02d}", "variable": "share", "month_year": m}
+            for g in range(n_geos)
+            for m in months
+        ]
+    )
+    var["value"] = rng.random(len(var))
+    var.loc[rng.random(len(var)) < 0.1, "value"] = np.nan
+    return var.loc[rng.random(len(var)) > 0.1].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_make_lagged_web_matches_reference(seed):
+    var = make_monthly_variable(seed)
+
+    result = make_lagged_web(var, "share").sort_index()
+    expected = make_lagged_web_reference(var, "share").sort_index()
+
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def fit_regression_reference(table, dep, indep_focus, cov_type="HC2"):
+    """Fixed effects regression with geography dummies"""
+    table_ = table.dropna(axis=0).sort_values("geo_cd")
+
+    Y = table_[dep]
+
+    indep = table_[[x for x in table_.columns if indep_focus in x]]
+
+    other_vars = table_.drop(
+        columns=[
+            "cl_count",
+            "cl_count_norm",
+            "exposure_share_present",
+            "exposure_share_lagged",
+            "low_div_share_present",
+            "low_div_share_lagged",
+            "geo_cd",
+            "month_year",
+        ]
+    )
+
+    fe = pd.get_dummies(table_["geo_cd"])
+
+    exog = pd.concat([indep, other_vars, fe], axis=1).astype(float)
+
+    lm = sm.OLS(endog=Y, exog=exog)
+    return lm.fit(cov_type=cov_type)
+
+
+def make_regression_table(seed, n_geos=12, n_months=8):
+    """Random regression table with place effects and missing values"""
+    rng = np.random.default_rng(seed)
+    table = pd.DataFrame(
+        [
+            {"geo_cd": f"S{g:02d}", "month_year": m}
+            for g in range(n_geos)
+            for m in pd.date_range("2020-05-01", periods=n_months, freq="MS")
+        ]
+    )
+    for var in [
+        "cl_count",
+        "exposure_share_present",
+        "exposure_share_lagged",
+        "low_div_share_present",
+        "low_div_share_lagged",
+        "eci",
+    ]:
+        table[var] = rng.random(len(table))
+    place_effects = table["geo_cd"].map(
+        dict(zip(sorted(set(table["geo_cd"])), rng.normal(size=n_geos)))
+    )
+    table["cl_count_norm"] = (
+        place_effects
+        + 0.5 * table["exposure_share_lagged"]
+        - 0.2 * table["eci"]
+        + rng.normal(scale=(1 + table["eci"]) / 10)
+    )
+    table.loc[rng.random(len(table)) < 0.05, "eci"] = np.nan
+    # Shuffle rows so the geographies aren't sorted
+    return table.sample(frac=1, random_state=seed)
+
+
+@pytest.mark.parametrize("cov_type", ["nonrobust", "HC0", "HC1", "HC2"])
+@pytest.mark.parametrize("seed", range(3))
+def test_fit_regression_matches_dummy_regression(seed, cov_type):
+    table = make_regression_table(seed)
+
+    result = fit_regression(
+        table, "cl_count_norm", "exposure_share_lagged", cov_type=cov_type
+    )
+    expected = fit_regression_reference(
+        table, "cl_count_norm", "exposure_share_lagged", cov_type=cov_type
+    )
+
+    focus = ["exposure_share_lagged", "eci"]
+    pd.testing.assert_series_equal(result.params[focus], expected.params[focus])
+    pd.testing.assert_series_equal(result.bse[focus], expected.bse[focus])
+    pd.testing.assert_frame_equal(
+        result.conf_int().loc[focus], expected.conf_int().loc[focus]
+    )
+
+    # Fixed effects are the dummy coefficients
+    pd.testing.assert_series_equal(
+        result.fixed_effects,
+        expected.params[result.fixed_effects.index],
+        check_names=False,
+    )
+
+    table_ = table.dropna()
+    pd.testing.assert_series_equal(
+        result.predict(table_),
+        expected.fittedvalues.loc[table_.index],
+        check_names=False,
+    )
@@ -0,0 +1,133 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+from Levenshtein import distance
+from nltk.stem import PorterStemmer
+
+from sg_covid_impact.nlp import (
+    get_category_salience,
+    remove_dupes,
+    salient_words_all_categories,
+)
+from sg_covid_impact.utils.list_utils import flatten_freq
+
+
+def make_tokenised_corpus(seed, n_docs=300, n_terms=60, n_categories=5):
+    """Random tokenised documents (with skewed term frequencies) and categories"""
+    rng = np.random.default_rng(seed)
+    terms = [f"term_{n}" for n in range(n_terms)]
+    probs = 1 / np.arange(1, n_terms + 1)
+    return pd.DataFrame(
+        {
+            "tokens": [
+                list(rng.choice(terms, size=rng.integers(0, 15), p=probs / probs.sum()))
+                for _ in range(n_docs)
+            ],
+            "division": rng.integers(0, n_categories, size=n_docs).astype(str),
+        }
+    )
+
+
+def sort_salience(df):
+    """Sort salient terms by salience and then alphabetically (the reference
+    implementation doesn't have a fixed order for ties)
+    """
+    return df.rename_axis("term").sort_values(
+        [df.columns[-1], "term"], ascending=[False, True]
+    )
+
+
+@pytest.mark.parametrize("thres", [0, 5])
+@pytest.mark.parametrize("seed", range(3))
+def test_salient_words_all_categories_matches_reference(seed, thres):
+    df = make_tokenised_corpus(seed)
+    corpus_freqs = flatten_freq(df["tokens"])
+
+    result = salient_words_all_categories(df["tokens"], df["division"], thres=thres)
+    assert set(result) == set(df["division"])
+
+    for cat, salient in result.items():
+        expected = get_category_salience(
+            df, "division", cat, "tokens", corpus_freqs, thres=thres
+        )
+        pd.testing.assert_frame_equal(
+            sort_salience(salient),
+            sort_salience(expected),
+            check_dtype=False,
+            check_index_type=False,
+        )
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_salient_words_all_categories_top_words(seed):
+    df = make_tokenised_corpus(seed)
+    corpus_freqs = flatten_freq(df["tokens"])
+
+    result = salient_words_all_categories(
+        df["tokens"], df["division"], thres=2, top_words=10
+    )
+
+    for cat, salient in result.items():
+        expected = get_category_salience(
+            df, "division", cat, "tokens", corpus_freqs, thres=2, top_words=10
+        )
+        # Terms tied at the cutoff can differ but not their salience
+        np.testing.assert_allclose(
+            salient[f"{cat}_salience"], expected[f"{cat}_salience"]
+        )
+        # Ties are broken alphabetically
+        assert salient.equals(sort_salience(salient).rename_axis(None))
+
+
+def remove_dupes_reference(results, div, lev_length=10, lev_dist=3):
+    """Pairwise implementation of remove_dupes"""
+    ps = PorterStemmer()
+
+    close_pairs = []
+    for p in combinations(results.index, 2):
+        if ps.stem(p[0]) == ps.stem(p[1]):
+            close_pairs.append(list(p))
+        elif len(p[0]) > lev_length:
+            if distance(p[0], p[1]) <= lev_dist:
+                close_pairs.append(list(p))
+
+    drop = [results.loc[c][f"{div}_freq"].idxmin() for c in close_pairs]
+
+    return results.loc[~results.index.isin(drop)]
+
+
+_STEMS = ["connect", "manufactur", "consult", "engineer", "design", "market"]
+_SUFFIXES = ["", "s", "ed", "ing", "ion", "er", "ers"]
+_BIGRAMS = [
+    "digital_marketing",
+    "digital_marketer",
+    "digital_markets",
+    "software_development",
+    "software_developer",
+    "software_developers",
+    "web_design",
+    "web_designs",
+    "property_management",
+    "project_management",
+]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_remove_dupes_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    terms = [stem + suffix for stem in _STEMS for suffix in _SUFFIXES] + _BIGRAMS
+    terms = list(rng.permutation(terms))
+    # Few distinct frequencies so that there are plenty of ties
+    results = pd.DataFrame(
+        {
+            "41_freq": rng.integers(1, 5, size=len(terms)),
+            "all_freq": rng.integers(5, 10, size=len(terms)),
+        },
+        index=terms,
+    )
+
+    pd.testing.assert_frame_equal(
+        remove_dupes(results, "41"), remove_dupes_reference(results, "41")
+    )
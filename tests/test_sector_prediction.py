@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sg_covid_impact import sector_prediction
+from sg_covid_impact.sector_prediction import validate_results, validate_results_single
+
+
+@pytest.fixture
+def divisions(monkeypatch):
+    """Divisions and a lookup to (made up) sections"""
+    divisions = [f"{n:02d}" for n in range(1, 21)]
+    monkeypatch.setattr(
+        sector_prediction,
+        "div_sect_lookup",
+        {div: "ABCD"[n % 4] for n, div in enumerate(divisions)},
+        raising=False,
+    )
+    return divisions
+
+
+def validate_results_reference(pred_df, labels, thres=0.2):
+    """Row by row implementation of validate_results"""
+    out = pd.DataFrame(
+        [
+            validate_results_single(pred_df.iloc[n], labels[n], thres=thres)
+            for n in np.arange(0, len(pred_df))
+        ]
+    )
+    out["true_label"] = labels
+    return out
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_validate_results_matches_reference(divisions, seed):
+    rng = np.random.default_rng(seed)
+    probs = rng.dirichlet(np.full(len(divisions), 0.3), size=200)
+    pred_df = pd.DataFrame(probs, columns=divisions)
+    labels = list(rng.choice(divisions, size=len(pred_df)))
+
+    pd.testing.assert_frame_equal(
+        validate_results(pred_df, labels, thres=0.05),
+        validate_results_reference(pred_df, labels, thres=0.05),
+    )
+
+
+def test_validate_results_unknown_label(divisions):
+    pred_df = pd.DataFrame(np.full((2, len(divisions)), 0.05), columns=divisions)
+
+    with pytest.raises(KeyError):
+        validate_results(pred_df, ["01", "99"])
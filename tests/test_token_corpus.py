@@ -0,0 +1,49 @@
+import numpy as np
+
+from sg_covid_impact.utils.token_corpus import TokenCorpus, write_token_corpus
+
+DOCS = {
+    "a": ["covid", "closed", "until", "further", "notice"],
+    "b": [],
+    "c": ["café", "open", "for", "takeaway", "covid"],
+    "d": ["open"],
+}
+
+
+def test_round_trip(tmp_path):
+    corpus = write_token_corpus(DOCS, tmp_path / "corpus")
+
+    assert len(corpus) == len(DOCS)
+    assert corpus.to_dict() == DOCS
+    assert list(corpus) == list(DOCS.values())
+    # Corpora can be iterated over more than once
+    assert list(corpus) == list(corpus)
+    # and read back from disk
+    assert TokenCorpus(tmp_path / "corpus").to_dict() == DOCS
+
+
+def test_round_trip_from_pairs(tmp_path):
+    pairs = [(np.int64(n), tokens) for n, tokens in enumerate(DOCS.values())]
+
+    corpus = write_token_corpus(iter(pairs), tmp_path)
+
+    assert corpus.ids() == list(range(len(DOCS)))
+    assert list(corpus.items()) == [(int(n), tokens) for n, tokens in pairs]
+
+
+def test_subset(tmp_path):
+    corpus = write_token_corpus(DOCS, tmp_path)
+
+    subset = corpus.subset(["d", "a", "missing"])
+
+    # Documents keep the corpus order
+    assert subset.to_dict() == {"a": DOCS["a"], "d": DOCS["d"]}
+    assert subset.subset(["d"]).to_dict() == {"d": DOCS["d"]}
+    assert len(corpus) == len(DOCS)
+
+
+def test_empty_documents(tmp_path):
+    corpus = write_token_corpus({"a": [], "b": []}, tmp_path / "empty")
+
+    assert corpus.to_dict() == {"a": [], "b": []}
+    assert write_token_corpus({}, tmp_path / "none").to_dict() == {}
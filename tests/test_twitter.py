@@ -0,0 +1,158 @@
+import json
+from datetime import datetime
+from functools import partial
+from itertools import chain
+
+import pandas as pd
+import pytest
+
+from sg_covid_impact.getters.twitter import get_tweets, get_users
+from sg_covid_impact.twitter import filter as twitter_filter
+from sg_covid_impact.twitter.filter import (
+    get_account_files,
+    ingest_tweets,
+    process_org_tweets,
+    write_tweet_batch,
+    write_users,
+)
+from sg_covid_impact.twitter.utils import timestamp_to_tweet_id
+
+FIRST_ID = timestamp_to_tweet_id(datetime(day=1, month=6, year=2020))
+OLD_ID = timestamp_to_tweet_id(datetime(day=1, month=6, year=2018))
+
+
+def make_user(screen_name):
+    return {"screen_name": screen_name, "name": screen_name.title(), "id": 1}
+
+
+def make_tweet(tweet_id, screen_name, retweet=False):
+    tweet = {
+        "created_at": "Mon Jun 01 10:00:00 +0000 2020",
+        "id": tweet_id,
+        "text": f"Tweet {tweet_id}",
+        "user": make_user(screen_name),
+        "followers_count": 10,
+        "friends_count": 5,
+        "retweet_count": 1,
+        "favorite_count": 2,
+        "lang": "en",
+        "source": "web",
+    }
+    if retweet:
+        tweet["retweeted_status"] = {"id": 1}
+    return tweet
+
+
+ACCOUNTS = {
+    "Acme": [make_tweet(FIRST_ID + n, "Acme") for n in range(4)],
+    "acme": [make_tweet(FIRST_ID + 10, "acme")],
+    "Bakery": [
+        make_tweet(FIRST_ID + 20, "Bakery"),
+        make_tweet(FIRST_ID + 21, "Bakery", retweet=True),
+        make_tweet(OLD_ID, "Bakery"),
+    ],
+    # Accounts without tweets to keep
+    "Empty": [],
+    "Old": [make_tweet(OLD_ID, "Old")],
+    "Zoo": [make_tweet(FIRST_ID + n, "Zoo") for n in range(30, 33)],
+}
+
+
+@pytest.fixture
+def twitter_data(tmp_path, monkeypatch):
+    """Raw account files ingested into the processed twitter directory"""
+    monkeypatch.setenv("temp_dir", str(tmp_path))
+    # Small row groups so that users only need some of them
+    monkeypatch.setattr(
+        twitter_filter,
+        "write_tweet_batch",
+        partial(write_tweet_batch, row_group_size=2),
+    )
+
+    in_path = tmp_path / "twitter_s3"
+    for n, (screen_name, tweets) in enumerate(ACCOUNTS.items()):
+        account_path = in_path / screen_name / str(n)
+        account_path.mkdir(parents=True)
+        (account_path / "tweets.json").write_text(json.dumps(tweets))
+
+    users = ingest_tweets(
+        sorted(get_account_files(in_path)), tmp_path / "twitter", batch_size=4, n_jobs=2
+    )
+    return users
+
+
+def expected_tweets():
+    """Tweets as processed by the JSON pipeline"""
+    processed = [
+        process_org_tweets(json.loads(json.dumps(tweets)))
+        for tweets in ACCOUNTS.values()
+        if tweets != []
+    ]
+    return (
+        pd.DataFrame(chain.from_iterable(tweets for _, tweets in processed))
+        .assign(user_lower=lambda x: x.user.str.lower())
+        .sort_values("id")
+        .reset_index(drop=True)
+    )
+
+
+def test_ingest_tweets_round_trip(twitter_data, tmp_path):
+    assert [user["screen_name"] for user in twitter_data] == [
+        "Acme",
+        "Bakery",
+        "Zoo",
+        "acme",
+    ]
+    assert len(list((tmp_path / "twitter" / "tweets").glob("*.parquet"))) > 1
+
+    tweets = get_tweets().sort_values("id").reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(tweets, expected_tweets())
+
+
+def test_get_tweets_of_users(twitter_data):
+    expected = expected_tweets()
+
+    tweets = get_tweets(columns=["id", "user"], users=["acme", "zoo"])
+
+    pd.testing.assert_frame_equal(
+        tweets.sort_values("id").reset_index(drop=True),
+        expected.loc[expected.user_lower.isin(["acme", "zoo"]), ["id", "user"]]
+        .reset_index(drop=True),
+    )
+
+
+def test_get_tweets_of_unknown_users(twitter_data):
+    tweets = get_tweets(columns=["id", "text"], users=["nobody"])
+
+    assert tweets.empty
+    assert tweets.columns.tolist() == ["id", "text"]
+
+
+def test_tweet_index(twitter_data, tmp_path):
+    index = pd.read_parquet(tmp_path / "twitter" / "tweet_index.parquet")
+    tweets_path = tmp_path / "twitter" / "tweets"
+
+    # The row groups in the index have all the tweets of each user
+    indexed = pd.concat(
+        pd.read_parquet(tweets_path / file)
+        .assign(row_group=lambda x: x.index // 2)
+        .merge(file_index, on=["user_lower", "row_group"])
+        for file, file_index in index.groupby("file")
+    )
+    assert sorted(indexed.id) == sorted(expected_tweets().id)
+    # and only the row groups with their tweets are indexed
+    assert len(indexed[index.columns].drop_duplicates()) == len(index)
+
+
+def test_get_users_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setenv("temp_dir", str(tmp_path))
+    (tmp_path / "twitter").mkdir()
+    users = [make_user(name) for name in ["Acme", "Bakery", "acme", "Café"]]
+
+    write_users(users, tmp_path / "twitter")
+
+    assert get_users() == users
+    assert get_users(screen_names=["acme", "café"]) == [users[0], *users[2:]]
+    assert get_users(screen_names=iter(["bakery", "bakery"])) == [users[1]]
+    assert get_users(screen_names=["Bakery", "nobody"]) == []